@@ -1,11 +1,138 @@
 import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
 from time import sleep
 import serial
 import numpy as np
 import h5py
 
+
+class CommandChannel():
+    # Pipelined command layer for the DAC firmware's serial shell. Commands
+    # are written without waiting for the previous prompt, up to
+    # max_in_flight at a time. The firmware answers in order, so a
+    # background reader thread hands each ">" prompt (and the last line
+    # before it) to the oldest outstanding command's Future.
+    #
+    # A command whose prompt has not arrived `timeout` seconds after it
+    # became the oldest fails with TimeoutError, together with everything
+    # queued behind it, and the input buffer is discarded so the next
+    # command starts in sync.
+    def __init__(self, port, timeout=0.5, max_in_flight=4, poll_interval=0.01):
+        self.port = port
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.write_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.head_started = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.port.timeout = self.poll_interval
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.read_loop, name="dac-serial", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, command):
+        # Returns a Future for the command's response line (None if it only
+        # printed the prompt)
+        if self.stopped.is_set():
+            raise ConnectionError("Command channel is closed.")
+        # The reader frees a slot for every prompt or timeout
+        self.slots.acquire()
+        future = Future()
+        with self.write_lock:
+            with self.lock:
+                if not self.pending:
+                    self.head_started = time.monotonic()
+                self.pending.append(future)
+            try:
+                self.port.write(command.encode("ascii"))
+                self.port.flush()
+            except Exception as e:
+                self.fail_all(e)
+        return future
+
+    def complete(self, response):
+        with self.lock:
+            if not self.pending:
+                # Prompt printed on connect or after a reset
+                return
+            future = self.pending.popleft()
+            self.head_started = time.monotonic()
+        self.slots.release()
+        future.set_result(response)
+
+    def fail_all(self, error):
+        with self.lock:
+            failed = list(self.pending)
+            self.pending.clear()
+        for future in failed:
+            self.slots.release()
+            future.set_exception(error)
+
+    def take_prompts(self, text, response):
+        # Each ">" at the start of a line completes one command; pipelined
+        # replies can run on after it ("> Register ..."), so the rest of
+        # the line is returned as the start of the next response
+        text = text.lstrip()
+        while text.startswith(b">"):
+            self.complete(response)
+            response = None
+            text = text[1:].lstrip()
+        return text, response
+
+    def read_loop(self):
+        partial = b""
+        response = None
+        while not self.stopped.is_set():
+            try:
+                data = self.port.read(max(1, self.port.in_waiting))
+            except Exception as e:
+                if not self.stopped.is_set():
+                    self.fail_all(ConnectionError(f"Serial read failed: {e}"))
+                break
+
+            if data:
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                for raw in lines:
+                    raw, response = self.take_prompts(raw, response)
+                    line = raw.decode("ascii", errors="ignore").strip()
+                    if line:
+                        response = line
+                # The prompt is not followed by a newline
+                partial, response = self.take_prompts(partial, response)
+                continue
+
+            with self.lock:
+                expired = self.pending and time.monotonic() - self.head_started > self.timeout
+            if expired:
+                self.fail_all(TimeoutError(f"No prompt from the DAC within {self.timeout} s"))
+                partial = b""
+                response = None
+                self.port.reset_input_buffer()
+
+    def close(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.fail_all(ConnectionError("Command channel closed."))
+
+
 class DAC():
-    def __init__(self, voltage_range, reference_voltage = 5, resolution = 20, serial_port="/dev/ttyACM0"):
+    # verify selects which register writes are read back: "always",
+    # "never", or "sample" (every verify_every-th write). set_voltage can
+    # override it per call.
+    def __init__(self, voltage_range, reference_voltage = 5, resolution = 20, serial_port="/dev/ttyACM0",
+                 timeout=0.5, max_in_flight=4, verify="always", verify_every=10):
         self.voltage_range = voltage_range
         self.reference_voltage = reference_voltage
         self.resolution = resolution
@@ -13,7 +140,20 @@ class DAC():
         self.baudrate = 115200
         self.serial_port = serial_port
         self.serial = None
+        self.channel = None
         self.voltage = None
+
+        if verify not in ("always", "never", "sample"):
+            raise ValueError(f"Unknown verify policy '{verify}'")
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.verify = verify
+        self.verify_every = max(1, verify_every)
+        self.writes = 0
+
+        # Whether each code is inside voltage_range, so validate_voltage is
+        # a lookup
+        self.code_valid = self.valid_codes(np.arange(1 << self.resolution))
     
 
         
@@ -45,6 +185,36 @@ class DAC():
 
         return voltage
     
+    def codes_to_voltages(self, hex_codes):
+        # Array version of convert_hex_to_voltage
+        codes = np.asarray(hex_codes, dtype=np.int64)
+        sign_bit = (codes >> (self.resolution - 1)) & 0x1
+        voltages = np.where(sign_bit, codes - (1 << self.resolution), codes) * self.lsb
+        return np.where(voltages > self.reference_voltage, voltages - self.reference_voltage, voltages)
+
+    def voltages_to_codes(self, voltages, clip=False):
+        # Array version of convert_voltage_to_hex. With clip, voltages
+        # outside voltage_range are clipped to it instead of rejected.
+        voltages = np.asarray(voltages, dtype=np.float64)
+        min_voltage, max_voltage = self.voltage_range
+        if clip:
+            voltages = np.clip(voltages, min_voltage, max_voltage)
+        else:
+            outside = (voltages < min_voltage) | (voltages > max_voltage)
+            if np.any(outside):
+                raise ValueError(f"{np.count_nonzero(outside)} voltages out of range [{min_voltage}, {max_voltage}]")
+
+        max_signed = (1 << (self.resolution - 1)) - 1
+        min_signed = - (1 << (self.resolution - 1))
+        signed = np.clip(np.round(voltages / self.lsb), min_signed, max_signed).astype(np.int64)
+        return signed & ((1 << self.resolution) - 1)
+
+    def valid_codes(self, hex_codes):
+        # Array version of validate_voltage
+        min_voltage, max_voltage = self.voltage_range
+        voltages = self.codes_to_voltages(hex_codes)
+        return (min_voltage < voltages) & (voltages < max_voltage)
+
     def initialize(self):
         try:
             self.serial = serial.Serial(
@@ -52,6 +222,7 @@ class DAC():
                 baudrate=self.baudrate,
                 timeout=1
             )
+            self.channel = CommandChannel(self.serial, self.timeout, self.max_in_flight).start()
             print("Initialized serial communication with DAC")
             self.set_voltage(0x0)
             print("Set voltage to 0 V")
@@ -64,21 +235,68 @@ class DAC():
         cmd = f"drr 1\n"
         return self.send_command(cmd)
     
-    def set_voltage(self, hex_code):
+    def write_register(self, register, value):
+        return self.channel.submit(f"drw {register} {hex(value).lower()}\n")
+
+    def read_register(self, register):
+        return self.channel.submit(f"drr {register}\n")
+
+    def should_verify(self, verify=None):
+        self.writes += 1
+        if verify is not None:
+            return verify
+        if self.verify == "sample":
+            return self.writes % self.verify_every == 0
+        return self.verify == "always"
+
+    def apply_code(self, hex_code, voltage, verify=None):
+        # set_voltage for a code that is already validated, e.g. from a
+        # sweep plan, given its expected voltage. The readback is queued
+        # right behind the write instead of waiting for the write's prompt.
+        write = self.write_register(1, hex_code)
+        readback = self.read_register(1) if self.should_verify(verify) else None
+        write.result()
+        if readback is not None:
+            self.voltage = self.parse_response(readback.result())
+        else:
+            self.voltage = voltage
+        return self.voltage
+
+    def set_voltage(self, hex_code, verify=None):
         if self.validate_voltage(hex_code):
-            cmd = f"drw 1 {hex(hex_code).lower()}\n"
-            self.send_command(cmd)
-            self.voltage = self.parse_response(self.read_voltage())
-            return self.voltage
+            return self.apply_code(hex_code, self.convert_hex_to_voltage(hex_code), verify)
         else:
             return f"{hex(hex_code)} ({self.convert_hex_to_voltage(hex_code)}) is out of range"
+
+    def set_voltages(self, hex_codes, verify=None):
+        # Queues every write (and readback) before waiting for any of them;
+        # the DAC ends at the last code. Returns the voltage of each step.
+        hex_codes = np.asarray(hex_codes, dtype=np.int64)
+        valid = self.valid_codes(hex_codes)
+        if not valid.all():
+            bad = int(hex_codes[~valid][0])
+            raise ValueError(f"{hex(bad)} ({self.convert_hex_to_voltage(bad)}) is out of range")
+        expected = self.codes_to_voltages(hex_codes)
+
+        steps = []
+        for hex_code in hex_codes.tolist():
+            write = self.write_register(1, hex_code)
+            readback = self.read_register(1) if self.should_verify(verify) else None
+            steps.append((write, readback))
+
+        voltages = []
+        for (write, readback), voltage in zip(steps, expected.tolist()):
+            write.result()
+            if readback is not None:
+                voltages.append(self.parse_response(readback.result()))
+            else:
+                voltages.append(voltage)
+        if voltages:
+            self.voltage = voltages[-1]
+        return voltages
     
     def validate_voltage(self, hex_code):
-        min_voltage, max_voltage = self.voltage_range
-        if min_voltage < self.convert_hex_to_voltage(hex_code) < max_voltage:
-            return True
-        else:
-            return False
+        return 0 <= hex_code < len(self.code_valid) and bool(self.code_valid[hex_code])
         
     def parse_response(self, response):
         hex_code = int(str(response).replace("Register 0x1 = ", ""), 16)
@@ -87,34 +305,16 @@ class DAC():
 
     
     def send_command(self, command):
-        if not self.serial or not self.serial.is_open:
+        if not self.serial or not self.serial.is_open or self.channel is None:
             raise ConnectionError("Serial port not initialized or already closed.")
-        data = command.encode('ascii')
-        self.serial.write(data)
-        self.serial.flush()
-
-        response_line = None
-        while True:
-            raw = self.serial.readline()
-            if not raw:
-                break
-
-            line = raw.decode('ascii', errors='ignore').strip()
-
-
-            if not line:
-                continue
-
-
-            if line == ">":
-                break
-
-            response_line = line
-        return response_line
+        return self.channel.submit(command).result()
     
 
 
     def close(self):
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
         if self.serial and self.serial.is_open:
             self.serial.close()
         return True
@@ -0,0 +1,174 @@
+import asyncio
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from daq import DAQ
+
+"""
+asyncio front end for DAQ.
+
+Frames are received with loop.sock_recv_into, decoded on the default
+executor and, when recording, written by a single-threaded executor so
+HDF5 writes keep their order and never run on the event loop. Decoding,
+status, metrics and storage all go through the wrapped DAQ instance.
+
+    async with AsyncDAQ(board_ip, filename="run.hdf5") as daq:
+        async for values, status in daq:
+            ...
+
+Decoded frames are shared with the writer; treat them as read-only.
+A recv that times out or is cancelled keeps the partially received frame,
+so iterating again resumes the stream without losing alignment.
+"""
+
+
+class AsyncDAQ:
+    def __init__(
+        self,
+        board_ip: str = "192.168.1.10",
+        port: int = 7,
+        samples: int = 1024 * 20,
+        channels: int = 4,
+        timestamp_header: int = 0,
+        filename: str = "test.hdf5",
+        record: bool = True,
+        queue_depth: int = 8,
+        connect_timeout: float | None = 5.0,
+        recv_timeout: float | None = 5.0,
+        **daq_kwargs,
+    ):
+        self.daq = DAQ(
+            board_ip,
+            port,
+            samples,
+            channels,
+            timestamp_header,
+            filename,
+            **daq_kwargs,
+        )
+        self.record = record
+        self.connect_timeout = connect_timeout
+        self.recv_timeout = recv_timeout
+
+        # Frames may be queued for writing while the next one is received;
+        # at most queue_depth of them before iteration waits
+        self.write_slots = asyncio.Semaphore(queue_depth)
+        self.pending_writes = set()
+        self.write_error = None
+        self.writer = None
+
+        self.buffer = bytearray(self.daq.frame_size)
+        self.received = 0
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            self.daq.configure_socket(sock)
+            await asyncio.wait_for(
+                loop.sock_connect(sock, (self.daq.board_ip, self.daq.port)),
+                self.connect_timeout,
+            )
+        except BaseException:
+            sock.close()
+            raise
+        self.daq.socket = sock
+        self.daq.connected = True
+        self.received = 0
+
+    def disconnect(self):
+        if not self.daq.connected:
+            return
+        try:
+            self.daq.disconnect()
+        except OSError:
+            # The board may already have closed its side
+            self.daq.socket.close()
+            self.daq.connected = False
+
+    async def open(self):
+        await self.connect()
+        if self.record:
+            self.writer = ThreadPoolExecutor(1, thread_name_prefix="daq-write")
+            await asyncio.get_running_loop().run_in_executor(
+                self.writer, self.daq.init_hdf5
+            )
+
+    async def close(self):
+        # Let queued writes finish, then flush and close the file
+        if self.pending_writes:
+            await asyncio.gather(*self.pending_writes, return_exceptions=True)
+        self.disconnect()
+        if self.writer is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                self.writer, self.daq.close_hdf5
+            )
+            self.writer.shutdown()
+            self.writer = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        # Finish closing even if the task using us was cancelled
+        await asyncio.shield(self.close())
+
+    async def download_frame(self):
+        loop = asyncio.get_running_loop()
+        view = memoryview(self.buffer)
+        start = time.perf_counter()
+        while self.received < self.daq.frame_size:
+            n = await asyncio.wait_for(
+                loop.sock_recv_into(self.daq.socket, view[self.received :]),
+                self.recv_timeout,
+            )
+            if not n:
+                print("Connection closed by remote.")
+                return
+            self.received += n
+        self.received = 0
+        self.daq.frame_received(start)
+        return self.buffer
+
+    def _write_done(self, future):
+        self.pending_writes.discard(future)
+        self.write_slots.release()
+        if not future.cancelled() and future.exception() is not None:
+            self.write_error = future.exception()
+
+    async def submit_write(self, values, header, offset, status):
+        await self.write_slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.writer, self.daq.write_data, values, header, offset, status
+        )
+        self.pending_writes.add(future)
+        future.add_done_callback(self._write_done)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.write_error is not None:
+            raise self.write_error
+
+        buffer = await self.download_frame()
+        if buffer is None:
+            raise StopAsyncIteration
+
+        loop = asyncio.get_running_loop()
+        values, offset, status = await loop.run_in_executor(
+            None, self.daq.process_frame, buffer
+        )
+        if self.writer is not None:
+            self.daq.frames_in_flight = len(self.pending_writes)
+            await self.submit_write(values, bytes(buffer[:offset]), offset, status)
+        return values, status
+
+    async def run(self, stop_event: asyncio.Event | None = None):
+        # Record until the board disconnects or stop_event is set
+        async with self:
+            async for _ in self:
+                if stop_event is not None and stop_event.is_set():
+                    break
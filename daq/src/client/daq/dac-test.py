@@ -1,63 +1,11 @@
 from dac import DAC
 from daq import DAQ
-import h5py
-from time import sleep
-import numpy as np
-from functools import partial
-import math
+from sweep import DacSweep, SweepPlan
 
 dac_channel = 1
 
 steps = 10000
-
-
-def collect_data(daq, dac_channel, file):
-    daq.connect()
-    while True:
-        restart = False
-        row = []
-
-        buffer = daq.download_frame()
-        words = daq.unpack_buffer(buffer)[0]
-        dac_output = dac.voltage
-        row.append(dac_output)
-
-        readings = []
-        for i in range(0, len(words), daq.channels):
-            code = words[i + dac_channel]
-            if not daq.pll_settled(code):
-                print("PLL IS NOT LOCKED")
-                restart = True
-                break
-
-            if not daq.no_chip_error(code):
-                print("CHIP ERROR")
-                restart = True
-                break
-
-            adc_reading = daq.convert_to_voltage(code)
-            readings.append(adc_reading)
-
-        if restart:
-            continue
-
-        mean = sum(readings) / len(readings)
-        std = float(np.std(readings, ddof=1))
-        se = std / math.sqrt(len(readings))
-
-        row.extend([mean, se])
-
-        print(row)
-
-        voltages = np.array(row, dtype=np.float32)
-        old_n = data_ds.shape[0]
-        new_n = old_n + voltages.shape[0]
-        data_ds.resize(new_n, axis=0)
-        data_ds[old_n:new_n] = voltages
-        file.flush()
-        break
-    daq.disconnect()
-
+order = "given"  # One of sweep.ORDERS
 
 file_name = "dac-test.hdf5"
 
@@ -68,30 +16,18 @@ dac = DAC(
     serial_port="/dev/ttyACM1",
 )
 
+# Every code is converted and validated before the DAC is touched
+plan = SweepPlan.from_codes(dac, range(0, 1 << dac.resolution, steps), order)
+
 dac.initialize()
 
 daq = DAQ()
 
+sweep = DacSweep(daq, dac, dac_channel, file_name)
 
-try:
-    with h5py.File(file_name, "w", libver="latest") as file:
-        data_ds = file.create_dataset(
-            "data", shape=(0, 3), maxshape=(None, 3), chunks=(1, 3), dtype="float32"
-        )
-
-        file.swmr_mode = True
-
-        counter = 0
-        for i in range(0, 1 << dac.resolution, steps):
-            if dac.set_voltage(i) == dac.voltage:
-                print(f"Set voltage to {dac.voltage}")
-                sleep(1)
-                collect_data(daq, dac_channel, file)
-            else:
-                print(
-                    f"Could not set voltage to {dac.convert_hex_to_voltage(i)} V (Code: {hex(i)})"
-                )
 
+try:
+    sweep.run(plan)
 
 except KeyboardInterrupt:
     print("Intterupted by user")
@@ -1,29 +1,225 @@
+import json
 import os
+import queue
 import socket
-import struct
+import threading
+import time
 import h5py
 import numpy as np
 import signal, sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    # No FIONREAD on Windows; receive-queue occupancy is not measured there
+    fcntl = termios = None
 
 """
-@todo Update FPGA to output timestamps
-@todo Separate logic for polling data and saving data into separate functions.
+@todo Enable the firmware's XTime frame header (HEADER_SIZE in parameters.h).
+      The client already stores per-frame ticks and reconstructs sample
+      times when timestamp_header is set.
 @todo AD4134 currently uses hard-coded parameters. Add configurable parameters 
       (e.g. ODR) for AD4134 before collecting data. ODR is currently configured
       in lines 171 and 179 of main.c. Update FPGA code to listen for incoming
       Ethernet packets with config information.
-@todo Support for detecting and logging PLL lock and chip error
-@todo Add timestamps for each frame and reconstruction
 @todo Increase amount of data transferred in Ethernet buffer. 
 @todo Real-time plotting
 """
 
 
+class OverviewPyramid:
+    # Multi-resolution summary of "data" maintained while acquiring. Level
+    # "overview/<factor>" holds one (min, max, mean) row per channel for
+    # every <factor> samples, shaped (blocks, 3, channels). Each level is
+    # reduced from the level below it, and samples that do not yet fill a
+    # block are carried over to the next append. filters are the HDF5
+    # compression keywords the levels are created with, as for "data".
+
+    def __init__(
+        self,
+        group,
+        channels: int,
+        factors: tuple[int, ...],
+        filters: dict | None = None,
+    ):
+        factors = sorted(factors)
+        previous = 1
+        self.ratios = []
+        for factor in factors:
+            if factor % previous:
+                raise ValueError(
+                    f"Overview factor {factor} is not a multiple of {previous}"
+                )
+            self.ratios.append(factor // previous)
+            previous = factor
+
+        self.factors = factors
+        self.channels = channels
+        self.filters = filters or {}
+        self.open_levels(group)
+        # Leftover (mins, maxs, means) rows per level, not yet a full block
+        self.carry = [None] * len(factors)
+
+    def open_levels(self, group):
+        # Also used when a capture rolls over to a new file: the carry is
+        # kept, so blocks continue seamlessly across segments
+        self.levels = []
+        for factor in self.factors:
+            ds = group.create_dataset(
+                str(factor),
+                shape=(0, 3, self.channels),
+                maxshape=(None, 3, self.channels),
+                chunks=(1024, 3, self.channels),
+                dtype="float32",
+                **self.filters,
+            )
+            ds.attrs["factor"] = factor
+            self.levels.append(ds)
+
+    def append(self, values):
+        mins = maxs = means = np.asarray(values)
+
+        for level, (ds, ratio) in enumerate(zip(self.levels, self.ratios)):
+            if self.carry[level] is not None:
+                carry_mins, carry_maxs, carry_means = self.carry[level]
+                mins = np.concatenate([carry_mins, mins])
+                maxs = np.concatenate([carry_maxs, maxs])
+                means = np.concatenate([carry_means, means])
+
+            whole = mins.shape[0] // ratio * ratio
+            self.carry[level] = (mins[whole:], maxs[whole:], means[whole:])
+            if not whole:
+                break
+
+            shape = (-1, ratio, mins.shape[1])
+            mins = mins[:whole].reshape(shape).min(axis=1)
+            maxs = maxs[:whole].reshape(shape).max(axis=1)
+            means = means[:whole].reshape(shape).mean(axis=1, dtype=np.float64)
+
+            old_n = ds.shape[0]
+            ds.resize(old_n + mins.shape[0], axis=0)
+            ds[old_n:] = np.stack([mins, maxs, means], axis=1)
+
+
+class Metrics:
+    # Low-overhead acquisition telemetry: counters, gauges and per-stage
+    # latency histograms with power-of-two microsecond buckets. Recording
+    # is a lock plus a few integer updates, cheap enough for every frame.
+    STAGES = ("recv_wait", "decode", "write", "flush", "arrival_jitter")
+    BUCKETS = 32
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {stage: [0] * self.BUCKETS for stage in self.STAGES}
+        self.totals = {stage: 0.0 for stage in self.STAGES}
+        self.maxima = {stage: 0.0 for stage in self.STAGES}
+        self.server = None
+
+    def record(self, stage, seconds):
+        bucket = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        with self.lock:
+            self.histograms[stage][bucket] += 1
+            self.totals[stage] += seconds
+            if seconds > self.maxima[stage]:
+                self.maxima[stage] = seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+        peak = f"{name}_max"
+        if value > self.gauges.get(peak, value - 1):
+            self.gauges[peak] = value
+
+    def percentile(self, stage, q):
+        # Upper edge of the bucket holding the q-th quantile, in seconds
+        histogram = self.histograms[stage]
+        target = q * sum(histogram)
+        seen = 0
+        for bucket, n in enumerate(histogram):
+            seen += n
+            if n and seen >= target:
+                return (1 << bucket) / 1e6
+        return 0.0
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage in self.STAGES:
+                n = sum(self.histograms[stage])
+                stages[stage] = {
+                    "count": n,
+                    "mean_ms": self.totals[stage] / n * 1e3 if n else 0.0,
+                    "p50_ms": self.percentile(stage, 0.5) * 1e3,
+                    "p99_ms": self.percentile(stage, 0.99) * 1e3,
+                    "max_ms": self.maxima[stage] * 1e3,
+                    "histogram_us": list(self.histograms[stage]),
+                }
+            return {
+                "uptime_sec": time.monotonic() - self.started,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "stages": stages,
+            }
+
+    def serve(self, host="127.0.0.1", port=9107):
+        # JSON snapshot at http://host:port/metrics, served from a daemon
+        # thread so it never blocks acquisition
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=self.server.serve_forever, name="daq-metrics", daemon=True
+        ).start()
+        return self.server.server_address
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
 class DAQ:
 
     BYTES_PER_SAMPLE = 4
     LSB = 4.096 / (2**23)
     TICKS_PER_SECOND = 666_666_687
+    METRICS_ATTR_SIZE = 16384
+    # One "status" record per frame: first row of the frame in "data",
+    # samples with the PLL unlocked / a chip error on any channel, and the
+    # first and last bad sample within the frame (-1 when the frame is clean)
+    STATUS_DTYPE = np.dtype(
+        [
+            ("row", "<i8"),
+            ("pll_unlocked", "<i4"),
+            ("chip_errors", "<i4"),
+            ("first_bad", "<i4"),
+            ("last_bad", "<i4"),
+        ]
+    )
 
     def __init__(
         self,
@@ -33,12 +229,39 @@ class DAQ:
         channels: int = 4,
         timestamp_header: int = 0,
         filename: str = "test.hdf5",
+        rx_ring_size: int = 2,
+        flush_frames: int | None = 1,
+        flush_interval: float | None = None,
+        grow_frames: int = 64,
+        storage: str = "float32",
+        compression: str | int | None = None,
+        compression_opts=None,
+        shuffle: bool = False,
+        overview_factors: tuple[int, ...] = (10, 100, 1000, 10_000, 100_000),
+        metrics_port: int | None = None,
+        metrics_attrs: bool = False,
+        report_interval: float | None = 10.0,
+        status_log_interval: float = 5.0,
+        status_callback=None,
+        run_id: str | None = None,
+        odr: float = 1e9 / 3000,
+        rotate_bytes: int | None = None,
+        rotate_interval: float | None = None,
+        publisher=None,
+        rcvbuf: int | None = None,
+        nodelay: bool = False,
+        quickack: bool = False,
+        rx_queue_alert: float = 0.75,
+        stall_frames: float = 4.0,
     ):
         self.board_ip = board_ip
         self.port = port
         self.samples = samples
         self.channels = channels
         self.timestamp_header = timestamp_header
+        # Output data rate in samples per second per channel, used to place
+        # samples between frame timestamps (PWM period of 3000 ns by default)
+        self.odr = odr
         self.filename = filename
         self.socket = None
         self.connected = False
@@ -49,27 +272,252 @@ class DAQ:
             self.samples * self.channels + self.timestamp_header
         ) * self.BYTES_PER_SAMPLE
 
+        # Reusable receive buffers, filled in place by socket.recv_into
+        self.rx_ring = [bytearray(self.frame_size) for _ in range(rx_ring_size)]
+        self.rx_index = 0
+
+        # Write batching. Frames are buffered until flush_frames frames or
+        # flush_interval seconds have accumulated (either may be None), or
+        # until flush() is called. Datasets grow grow_frames frames at a time
+        # and the "rows" dataset records how many rows are valid.
+        self.flush_frames = flush_frames
+        self.flush_interval = flush_interval
+        self.grow_frames = max(1, grow_frames)
+
+        # Storage. "float32" stores volts, "int32" stores the sign-extended
+        # 24-bit codes losslessly with LSB recorded as a dataset attribute.
+        # compression takes any h5py filter ("gzip", "lzf" or a filter id).
+        if storage not in ("float32", "int32"):
+            raise ValueError(f"Unsupported storage mode '{storage}'")
+        self.storage = storage
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+
+        # Reduction factors of the min/max/mean overview levels kept next to
+        # "data" (empty to disable)
+        self.overview_factors = tuple(overview_factors or ())
+        self.pyramid = None
+
+        # Telemetry. metrics_port serves live snapshots over HTTP,
+        # metrics_attrs copies them into the "metrics" attribute of "data",
+        # and a one-line summary is printed every report_interval seconds.
+        self.metrics = Metrics()
+        self.metrics_port = metrics_port
+        self.metrics_attrs = metrics_attrs
+        self.report_interval = report_interval
+        self.last_report = time.monotonic()
+        self.frames_in_flight = 0
+
+        # Bad frames are printed at most once per status_log_interval
+        # seconds; status_callback(frame_number, status) sees every one
+        self.status_log_interval = status_log_interval
+        self.status_callback = status_callback
+        self.last_status_log = None
+        self.suppressed_status = 0
+
+        # Shared by every board recorded in the same run
+        self.run_id = run_id
+
+        # Rollover. With rotate_bytes and/or rotate_interval set, the capture
+        # is split into "<stem>-0000.hdf5", "<stem>-0001.hdf5", ... listed in
+        # "<stem>.manifest.json", which readers open as one capture.
+        self.rotate_bytes = rotate_bytes
+        self.rotate_interval = rotate_interval
+        self.segments = []
+        self.row_offset = 0
+
+        # Optional live feed, e.g. a live_ring.LiveRing. Every frame is
+        # passed to publisher.publish(volts, first_row) as soon as it is
+        # decoded, independent of the flush policy.
+        self.publisher = publisher
+
+        # Link tuning. rcvbuf sets SO_RCVBUF (the kernel may round it, the
+        # granted size is kept in rcvbuf_bytes), nodelay sets TCP_NODELAY
+        # and quickack re-arms TCP_QUICKACK after every frame where the
+        # platform has it.
+        self.rcvbuf = rcvbuf
+        self.nodelay = nodelay
+        self.quickack = quickack and hasattr(socket, "TCP_QUICKACK")
+        self.rcvbuf_bytes = None
+
+        # Link health. An alert is raised when the kernel receive queue is
+        # more than rx_queue_alert of the receive buffer (the host is
+        # falling behind and the board will soon stall), when no frame
+        # arrives for stall_frames frame periods, and when consecutive
+        # timestamp headers are not one frame apart (frames were dropped or
+        # the board stalled). Alerts share the status_log_interval limit.
+        self.rx_queue_alert = rx_queue_alert
+        self.stall_frames = stall_frames
+        self.frame_period = self.samples / self.odr
+        self.last_arrival = None
+        self.last_ticks = None
+        self.last_link_log = None
+        self.suppressed_link = 0
+
+        self.file = None
+        self.rows = 0
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    @property
+    def rotating(self) -> bool:
+        return self.rotate_bytes is not None or self.rotate_interval is not None
+
+    @staticmethod
+    def manifest_name(filename: str) -> str:
+        return os.path.splitext(filename)[0] + ".manifest.json"
+
+    def segment_name(self) -> str:
+        if not self.rotating:
+            return self.filename
+        stem, ext = os.path.splitext(self.filename)
+        return f"{stem}-{len(self.segments):04d}{ext}"
+
     def init_hdf5(self):
-        self.file = h5py.File(self.filename, "w", libver="latest")
+        self.segments = []
+        self.row_offset = 0
+        self.pyramid = None
+        self.open_segment()
+
+    def open_segment(self):
+        segment_name = self.segment_name()
+        self.file = h5py.File(segment_name, "w", libver="latest")
+        self.file.attrs["board"] = f"{self.board_ip}:{self.port}"
+        if self.run_id is not None:
+            self.file.attrs["run_id"] = self.run_id
         self.data_ds = self.file.create_dataset(
             "data",
             shape=(0, self.channels),
             maxshape=(None, self.channels),
             chunks=(self.samples, self.channels),
-            dtype="float32",
+            dtype=self.storage,
+            compression=self.compression,
+            compression_opts=self.compression_opts,
+            shuffle=self.shuffle,
+        )
+        self.data_ds.attrs["LSB"] = self.LSB
+        self.data_ds.attrs["units"] = "code" if self.storage == "int32" else "V"
+        if self.metrics_attrs:
+            # Attributes can only be rewritten in place under SWMR, so
+            # reserve a fixed-size slot for the JSON snapshot up front
+            self.data_ds.attrs.create(
+                "metrics", np.bytes_(""), dtype=f"S{self.METRICS_ATTR_SIZE}"
+            )
+
+        if self.timestamp_header:
+            # One XTime tick count per frame, taken at its first sample;
+            # readers add row / odr within the frame for per-sample times
+            self.frame_ticks_ds = self.file.create_dataset(
+                "frame_ticks",
+                shape=(0,),
+                maxshape=(None,),
+                chunks=(1024,),
+                dtype="uint64",
+            )
+            self.frame_ticks_ds.attrs["ticks_per_second"] = self.TICKS_PER_SECOND
+            self.frame_ticks_ds.attrs["odr"] = self.odr
+            self.frame_ticks_ds.attrs["samples"] = self.samples
+
+        # Number of valid rows in "data"; the dataset itself is preallocated.
+        # Written at creation so its storage exists before SWMR starts.
+        self.rows_ds = self.file.create_dataset("rows", data=np.zeros(1, dtype="int64"))
+
+        self.status_ds = self.file.create_dataset(
+            "status",
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(1024,),
+            dtype=self.STATUS_DTYPE,
         )
+        self.status_ds.attrs["samples"] = self.samples
+
+        if self.pyramid is not None:
+            self.pyramid.open_levels(self.file.create_group("overview"))
+        elif self.overview_factors:
+            self.pyramid = OverviewPyramid(
+                self.file.create_group("overview"),
+                self.channels,
+                self.overview_factors,
+                filters=dict(
+                    compression=self.compression,
+                    compression_opts=self.compression_opts,
+                    shuffle=self.shuffle,
+                ),
+            )
+        self.rows = 0
+        self.frames_stored = 0
+        self.pending = []
+        self.last_flush = time.monotonic()
 
         self.file.swmr_mode = True
+        self.segment_started = time.monotonic()
+        print(f"Writing to '{segment_name}'...")
 
-        if self.timestamp_header:
-            self.time_ds = self.file.create_dataset(
-                "time",
-                shape=(0, 1),
-                maxshape=(None, 1),
-                chunks=(self.samples, 1),
-                dtype="float32",
+        if self.rotating:
+            self.segments.append(
+                {
+                    "file": os.path.basename(segment_name),
+                    "first_row": self.row_offset,
+                    "rows": None,
+                    "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
             )
-        print(f"Writing to '{self.filename}'...")
+            self.write_manifest()
+
+    def write_manifest(self):
+        # Replaced atomically so readers never see a partial manifest
+        manifest = {
+            "run_id": self.run_id,
+            "samples": self.samples,
+            "channels": self.channels,
+            "storage": self.storage,
+            "segments": self.segments,
+        }
+        manifest_name = self.manifest_name(self.filename)
+        with open(manifest_name + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_name + ".tmp", manifest_name)
+
+    def rotate_due(self) -> bool:
+        if self.rotate_bytes is not None:
+            if os.path.getsize(self.file.filename) >= self.rotate_bytes:
+                return True
+        if self.rotate_interval is not None:
+            return time.monotonic() - self.segment_started >= self.rotate_interval
+        return False
+
+    def rotate(self):
+        self.close_segment()
+        self.row_offset += self.rows
+        self.open_segment()
+        self.metrics.count("segments")
+
+    def close_hdf5(self):
+        if self.file is None:
+            return
+        # Callers have drained their queues by now, so nothing is behind
+        # once the last frames are flushed
+        self.frames_in_flight = 0
+        # No rollover on the last flush; the new segment would stay empty
+        self.flush(rotate=False)
+        self.metrics.gauge("frames_behind", 0)
+        self.close_segment()
+
+    def close_segment(self):
+        self.store_metrics()
+
+        # The preallocated tail stays: SWMR readers may still be following
+        # the file and datasets can only grow under SWMR. Readers stop at
+        # "rows", or at the manifest's row count once a segment is closed,
+        # which is published before the file closes so readers are done
+        # with its "rows" dataset by then.
+        if self.rotating:
+            self.file.flush()
+            self.segments[-1]["rows"] = self.rows
+            self.write_manifest()
+        self.file.close()
+        self.file = None
 
     @staticmethod
     def pll_settled(code: int) -> int:
@@ -97,13 +545,69 @@ class DAQ:
         return raw24 * DAQ.LSB
 
     @staticmethod
-    def convert_to_timestamp_sec(header: tuple[int, int]) -> float:
+    def decode_codes(words, channels: int):
+        words = np.asarray(words, dtype=np.uint32).reshape(-1, channels)
+
+        # Arithmetic shift of the signed view sign-extends the 24-bit code
+        codes = words.view(np.int32) >> 8
+
+        pll_locked = (words & 0x00000040) != 0
+        no_chip_error = (words & 0x00000080) != 0
+        return codes, pll_locked, no_chip_error
+
+    @staticmethod
+    def decode_frame(words, channels: int):
+        codes, pll_locked, no_chip_error = DAQ.decode_codes(words, channels)
+        voltages = (codes * DAQ.LSB).astype(np.float32)
+        return voltages, pll_locked, no_chip_error
+
+    @classmethod
+    def frame_status(cls, pll_locked, no_chip_error):
+        # Per-frame summary of the status bits; a sample is bad when any
+        # channel has either flag cleared
+        pll_bad = ~pll_locked.all(axis=1)
+        chip_bad = ~no_chip_error.all(axis=1)
+        status = np.zeros((), dtype=cls.STATUS_DTYPE)
+        status["pll_unlocked"] = np.count_nonzero(pll_bad)
+        status["chip_errors"] = np.count_nonzero(chip_bad)
+        bad = np.flatnonzero(pll_bad | chip_bad)
+        status["first_bad"] = bad[0] if bad.size else -1
+        status["last_bad"] = bad[-1] if bad.size else -1
+        return status
+
+    @staticmethod
+    def header_ticks(header: tuple[int, int]) -> int:
         hi, lo = header
-        ticks = (hi << 32) | lo
-        return ticks / DAQ.TICKS_PER_SECOND
+        return (hi << 32) | lo
+
+    @staticmethod
+    def convert_to_timestamp_sec(header: tuple[int, int]) -> float:
+        return DAQ.header_ticks(header) / DAQ.TICKS_PER_SECOND
+
+    def configure_socket(self, sock):
+        # Buffer sizes have to be set before connecting to affect the TCP
+        # window the board is offered
+        if self.rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.nodelay:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.quickack:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+        self.rcvbuf_bytes = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        self.metrics.gauge("rcvbuf_bytes", self.rcvbuf_bytes)
+        # A new connection is a new stream
+        self.last_arrival = None
+        self.last_ticks = None
 
     def connect(self):
-        self.socket = socket.create_connection((self.board_ip, self.port))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            self.configure_socket(sock)
+            sock.connect((self.board_ip, self.port))
+        except BaseException:
+            sock.close()
+            raise
+        self.socket = sock
         self.connected = True
         # print(f"Connected to {self.board_ip}:{self.port}")
 
@@ -120,70 +624,418 @@ class DAQ:
     def _on_term(self, signum, frame):
         raise SystemExit
 
-    def download_frame(self):
-        buffer = b""
-        while len(buffer) < self.frame_size:
-            chunk = self.socket.recv(self.frame_size - len(buffer))
-            if not chunk:
+    def download_frame(self, buffer=None):
+        if buffer is None:
+            buffer = self.rx_ring[self.rx_index]
+            self.rx_index = (self.rx_index + 1) % len(self.rx_ring)
+
+        view = memoryview(buffer)
+        received = 0
+        start = time.perf_counter()
+        while received < self.frame_size:
+            n = self.socket.recv_into(view[received:], self.frame_size - received)
+            if not n:
                 print("Connection closed by remote.")
                 return
-            buffer += chunk
+            received += n
+        self.frame_received(start)
         return buffer
 
+    def rx_queued(self) -> int | None:
+        # Bytes received by the kernel but not yet read by us
+        if fcntl is None or self.socket is None:
+            return None
+        queued = fcntl.ioctl(self.socket.fileno(), termios.FIONREAD, bytes(4))
+        return int.from_bytes(queued, sys.byteorder)
+
+    def frame_received(self, start: float):
+        # Called by every receive loop once a whole frame is in; start is
+        # when it began waiting for the frame
+        now = time.perf_counter()
+        self.metrics.record("recv_wait", now - start)
+        self.metrics.count("frames_received")
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            self.metrics.record("arrival_jitter", abs(interval - self.frame_period))
+            if interval > self.stall_frames * self.frame_period:
+                self.metrics.count("arrival_stalls")
+                self.link_alert(
+                    f"No frame for {interval * 1e3:.1f} ms "
+                    f"({interval / self.frame_period:.1f} frame periods)"
+                )
+        self.last_arrival = now
+
+        if self.quickack:
+            # Linux clears TCP_QUICKACK again after it is used
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+        queued = self.rx_queued()
+        if queued is None:
+            return
+        self.metrics.gauge("rx_queue_bytes", queued)
+        if self.rcvbuf_bytes and queued > self.rx_queue_alert * self.rcvbuf_bytes:
+            self.metrics.count("rx_queue_alerts")
+            self.link_alert(
+                f"Receive queue at {queued} of {self.rcvbuf_bytes} bytes; "
+                "the host is falling behind the board"
+            )
+
+    def check_ticks(self, ticks: int):
+        # Consecutive frames should start exactly one frame period apart
+        last, self.last_ticks = self.last_ticks, ticks
+        if last is None:
+            return
+        expected = self.frame_period * self.TICKS_PER_SECOND
+        frames = (ticks - last) / expected
+        if abs(frames - 1) < 0.5:
+            return
+        self.metrics.count("tick_gaps")
+        if frames > 1:
+            missing = round(frames) - 1
+            self.metrics.count("frames_missing", missing)
+            problem = f"{missing} frames missing before frame {self.frame_count}"
+        else:
+            problem = f"timestamps went back {frames - 1:.1f} frames at frame {self.frame_count}"
+        self.link_alert(f"Tick gap: {problem}")
+
+    def link_alert(self, message):
+        now = time.monotonic()
+        if (
+            self.last_link_log is not None
+            and now - self.last_link_log < self.status_log_interval
+        ):
+            self.suppressed_link += 1
+            return
+        self.last_link_log = now
+        if self.suppressed_link:
+            message += f" ({self.suppressed_link} more link alerts not shown)"
+            self.suppressed_link = 0
+        print(message)
+
     def unpack_buffer(self, buffer):
         offset = self.timestamp_header * self.BYTES_PER_SAMPLE
-        raw = buffer[offset:]
-        words = struct.unpack(f"<{self.samples * self.channels}I", raw)
+        words = np.frombuffer(
+            buffer, dtype="<u4", count=self.samples * self.channels, offset=offset
+        )
         return words, offset
 
-    def write_data(self, voltages, buffer, offset):
-        # Append to dataset
-        old_n = self.data_ds.shape[0]
+    def write_data(self, voltages, buffer, offset, status=None):
+        ticks = None
+        if self.timestamp_header:
+            # Unpack header words
+            hdr_words = np.frombuffer(buffer, dtype="<u4", count=self.timestamp_header)
+            ticks = self.header_ticks(tuple(int(w) for w in hdr_words))
+            self.check_ticks(ticks)
+
+        if status is None:
+            status = np.zeros((), dtype=self.STATUS_DTYPE)
+            status["first_bad"] = status["last_bad"] = -1
+        status["row"] = (
+            self.row_offset + self.rows + sum(v.shape[0] for v, _, _ in self.pending)
+        )
+        if status["first_bad"] >= 0:
+            self.report_status(status)
+        if self.publisher is not None:
+            self.publisher.publish(
+                voltages * self.LSB if self.storage == "int32" else voltages,
+                int(status["row"]),
+            )
+
+        self.pending.append((voltages, ticks, status))
+        self.frame_count += 1
+        self.metrics.gauge("frames_behind", self.frames_in_flight + len(self.pending))
+        if self.flush_due():
+            self.flush()
+
+    def flush_due(self) -> bool:
+        if not self.pending:
+            return False
+        if self.flush_frames and len(self.pending) >= self.flush_frames:
+            return True
+        if self.flush_interval is not None:
+            return time.monotonic() - self.last_flush >= self.flush_interval
+        return False
+
+    def flush(self, rotate: bool = True):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+
+        write_start = time.perf_counter()
+        voltages = np.concatenate([v for v, _, _ in self.pending])
+        old_n = self.rows
         new_n = old_n + voltages.shape[0]
-        self.data_ds.resize(new_n, axis=0)
+
+        # Grow in large steps rather than one frame at a time
+        if new_n > self.data_ds.shape[0]:
+            step = self.grow_frames * self.samples
+            capacity = -(-new_n // step) * step
+            self.data_ds.resize(capacity, axis=0)
+
         self.data_ds[old_n:new_n] = voltages
 
-        # Handle timestamps
+        old_frames = self.frames_stored
+        self.frames_stored += len(self.pending)
+        if self.frames_stored > self.status_ds.shape[0]:
+            capacity = -(-self.frames_stored // self.grow_frames) * self.grow_frames
+            self.status_ds.resize(capacity, axis=0)
+            if self.timestamp_header:
+                self.frame_ticks_ds.resize(capacity, axis=0)
+        self.status_ds[old_frames : self.frames_stored] = np.stack(
+            [status for _, _, status in self.pending]
+        )
         if self.timestamp_header:
-            # Unpack header words
-            hdr_words = struct.unpack(f"<{self.timestamp_header}I", buffer[:offset])
-            ts = self.convert_to_timestamp_sec(tuple(hdr_words))
-            self.time_ds.resize(new_n, axis=0)
-            self.time_ds[old_n:new_n, 0] = ts
+            self.frame_ticks_ds[old_frames : self.frames_stored] = np.array(
+                [ticks for _, ticks, _ in self.pending], dtype=np.uint64
+            )
+
+        if self.pyramid is not None:
+            if self.storage == "int32":
+                self.pyramid.append(voltages * self.LSB)
+            else:
+                self.pyramid.append(voltages)
 
+        flush_start = time.perf_counter()
+        self.metrics.record("write", flush_start - write_start)
+        # The new rows reach the file before "rows" counts them, so SWMR
+        # readers (which read "rows" first) never see unwritten rows
         self.file.flush()
-        self.frame_count += 1
-        print(f"Frame {self.frame_count} stored (total rows: {new_n})")
+        self.rows = new_n
+        self.rows_ds[0] = new_n
+        self.file.flush()
+        self.metrics.record("flush", time.perf_counter() - flush_start)
+        self.metrics.count("frames_stored", len(self.pending))
+        self.metrics.gauge("rows", self.row_offset + new_n)
+        self.pending = []
+        self.metrics.gauge("frames_behind", self.frames_in_flight)
+        if rotate and self.rotating and self.rotate_due():
+            self.rotate()
+        self.report()
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and (
+            self.report_interval is None
+            or now - self.last_report < self.report_interval
+        ):
+            return
+        self.last_report = now
+
+        snapshot = self.metrics.snapshot()
+        stored = snapshot["counters"].get("frames_stored", 0)
+        rate = stored * self.frame_size / max(snapshot["uptime_sec"], 1e-9) / 1e6
+        print(
+            f"{stored} frames stored ({self.row_offset + self.rows} rows, "
+            f"{rate:.1f} MB/s avg), "
+            f"{snapshot['gauges'].get('frames_behind', 0)} frames behind, "
+            f"{snapshot['counters'].get('overruns', 0)} overruns, "
+            f"{self.link_alerts(snapshot['counters'])} link alerts"
+        )
+        self.store_metrics(snapshot)
+
+    @staticmethod
+    def link_alerts(counters) -> int:
+        return sum(
+            counters.get(name, 0)
+            for name in ("rx_queue_alerts", "arrival_stalls", "tick_gaps")
+        )
+
+    def store_metrics(self, snapshot=None):
+        if not self.metrics_attrs or self.file is None:
+            return
+        snapshot = json.dumps(snapshot or self.metrics.snapshot()).encode()
+        self.data_ds.attrs.modify("metrics", snapshot)
+
+    def process_frame(self, buffer):
+        start = time.perf_counter()
+        words, offset = self.unpack_buffer(buffer)
+        if self.storage == "int32":
+            values, pll_locked, no_chip_error = self.decode_codes(words, self.channels)
+        else:
+            values, pll_locked, no_chip_error = self.decode_frame(words, self.channels)
+        status = self.frame_status(pll_locked, no_chip_error)
+        self.metrics.record("decode", time.perf_counter() - start)
+        return values, offset, status
+
+    def report_status(self, status):
+        if status["pll_unlocked"]:
+            self.metrics.count("pll_unlocked_frames")
+        if status["chip_errors"]:
+            self.metrics.count("chip_error_frames")
+        if self.status_callback is not None:
+            self.status_callback(self.frame_count, status)
+
+        now = time.monotonic()
+        if (
+            self.last_status_log is not None
+            and now - self.last_status_log < self.status_log_interval
+        ):
+            self.suppressed_status += 1
+            return
+        self.last_status_log = now
+
+        problems = []
+        if status["pll_unlocked"]:
+            problems.append(f"PLL IS NOT LOCKED ({status['pll_unlocked']} samples)")
+        if status["chip_errors"]:
+            problems.append(f"CHIP ERROR ({status['chip_errors']} samples)")
+        message = (
+            f"Frame {self.frame_count}: {', '.join(problems)} "
+            f"at samples {status['first_bad']}-{status['last_bad']}"
+        )
+        if self.suppressed_status:
+            message += f" ({self.suppressed_status} more bad frames not shown)"
+            self.suppressed_status = 0
+        print(message)
+
+    def start_metrics(self):
+        if self.metrics_port is not None and self.metrics.server is None:
+            host, port = self.metrics.serve(port=self.metrics_port)
+            print(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def stop_metrics(self):
+        self.report(force=True)
+        self.metrics.close()
 
     def run(self, stop_event=None):
         signal.signal(signal.SIGTERM, self._on_term)
         if not self.connected:
             self.connect()
+        self.start_metrics()
 
         try:
             while stop_event is None or not stop_event.is_set():
                 buffer = self.download_frame()
+                if buffer is None:
+                    break
 
-                words, offset = self.unpack_buffer(buffer)
-                # print(words)
-                # raise KeyboardInterrupt
+                voltages, offset, status = self.process_frame(buffer)
+                self.write_data(voltages, buffer, offset, status)
 
-                # Convert to voltages
-                rows = []
-                for i in range(0, len(words), self.channels):
-                    row = []
-                    for c in range(self.channels):
-                        code = words[i + c]
-                        if not self.pll_settled(code):
-                            print("PLL IS NOT LOCKED")
-                        if not self.no_chip_error(code):
-                            print("CHIP ERROR")
-                        row.append(self.convert_to_voltage(code))
-                    rows.append(row)
+        except KeyboardInterrupt:
+            print("\nInterrupted by user.")
 
-                voltages = np.array(rows, dtype=np.float32)
+        except SystemExit:
+            print("\nInterrupted by terminate (SIGTERM)")
+        finally:
+            self.disconnect()
+            self.close_hdf5()
+            self.stop_metrics()
+
+    def run_pipelined(self, stop_event=None, queue_depth: int = 8):
+        # The calling thread only drains the socket into a pool of
+        # queue_depth frame buffers. Decode and HDF5 writing run on worker
+        # threads behind bounded queues, so a slow flush blocks the receiver
+        # instead of growing memory. Each wait for a free buffer is counted
+        # as an overrun in self.pipeline_stats.
+        signal.signal(signal.SIGTERM, self._on_term)
+        if not self.connected:
+            self.connect()
+        self.start_metrics()
+
+        free_q = queue.Queue()
+        for _ in range(queue_depth):
+            free_q.put(bytearray(self.frame_size))
+        decode_q = queue.Queue(maxsize=queue_depth)
+        write_q = queue.Queue(maxsize=queue_depth)
+        failed = threading.Event()
+
+        self.pipeline_stats = {
+            "frames_received": 0,
+            "frames_decoded": 0,
+            "frames_written": 0,
+            "overruns": 0,
+            "overrun_wait_sec": 0.0,
+            "max_decode_depth": 0,
+            "max_write_depth": 0,
+        }
+        stats = self.pipeline_stats
 
-                self.write_data(voltages, buffer, offset)
+        def decode_worker():
+            try:
+                while True:
+                    buffer = decode_q.get()
+                    if buffer is None:
+                        break
+                    voltages, offset, status = self.process_frame(buffer)
+                    header = bytes(buffer[:offset])
+                    free_q.put(buffer)
+                    stats["frames_decoded"] += 1
+
+                    write_q.put((voltages, header, offset, status))
+                    stats["max_write_depth"] = max(
+                        stats["max_write_depth"], write_q.qsize()
+                    )
+                    self.metrics.gauge("write_queue_depth", write_q.qsize())
+            except Exception as e:
+                print(f"Decode worker failed: {e}")
+                failed.set()
+                # Keep draining so the receiver never blocks on a full queue
+                while decode_q.get() is not None:
+                    pass
+            finally:
+                write_q.put(None)
+
+        def write_worker():
+            try:
+                while True:
+                    try:
+                        item = write_q.get(timeout=self.flush_interval)
+                    except queue.Empty:
+                        # No new frames, but a time-based flush may be due
+                        if self.flush_due():
+                            self.flush()
+                        continue
+                    if item is None:
+                        break
+                    self.frames_in_flight = decode_q.qsize() + write_q.qsize()
+                    self.write_data(*item)
+                    stats["frames_written"] += 1
+            except Exception as e:
+                print(f"Write worker failed: {e}")
+                failed.set()
+                # Keep draining so the decoder never blocks on a full queue
+                while write_q.get() is not None:
+                    pass
+
+        workers = [
+            threading.Thread(target=decode_worker, name="daq-decode", daemon=True),
+            threading.Thread(target=write_worker, name="daq-write", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while not failed.is_set() and (
+                stop_event is None or not stop_event.is_set()
+            ):
+                try:
+                    buffer = free_q.get_nowait()
+                except queue.Empty:
+                    # Backpressure: every buffer is queued for decode or write
+                    stats["overruns"] += 1
+                    start = time.perf_counter()
+                    buffer = None
+                    while buffer is None and not failed.is_set():
+                        try:
+                            buffer = free_q.get(timeout=0.1)
+                        except queue.Empty:
+                            pass
+                    if buffer is None:
+                        break
+                    waited = time.perf_counter() - start
+                    stats["overrun_wait_sec"] += waited
+                    self.metrics.count("overruns")
+
+                if self.download_frame(buffer) is None:
+                    break
+                stats["frames_received"] += 1
+
+                decode_q.put(buffer)
+                stats["max_decode_depth"] = max(
+                    stats["max_decode_depth"], decode_q.qsize()
+                )
+                self.metrics.gauge("decode_queue_depth", decode_q.qsize())
 
         except KeyboardInterrupt:
             print("\nInterrupted by user.")
@@ -191,7 +1043,17 @@ class DAQ:
         except SystemExit:
             print("\nInterrupted by terminate (SIGTERM)")
         finally:
+            # Let the workers drain every frame that was already received
+            decode_q.put(None)
+            for worker in workers:
+                worker.join()
             self.disconnect()
+            self.close_hdf5()
+            self.stop_metrics()
+            print(
+                f"Pipeline stopped: {stats['frames_received']} received, "
+                f"{stats['frames_written']} written, {stats['overruns']} overruns"
+            )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+import h5py
+import numpy as np
+from daq import DAQ
+from simulator import BoardSimulator
+
+"""
+Measures how fast the DAQ client can ingest frames from a local simulated
+board, stage by stage and end to end.
+
+Every combination of frame size, channel count, storage dtype and flush
+policy is timed for download_frame, unpack_buffer, decode (decode_frame or
+decode_codes plus frame_status, on already unpacked words) and write_data,
+then for a full run_pipelined capture. Each stage reports frames/s, MB/s
+of raw frame data and ns per sample. Results are written as JSON so two
+versions of the client can be compared.
+"""
+
+frame_sizes = [1024 * 5, 1024 * 20]
+channel_counts = [1, 2, 4]
+storages = ["float32", "int32"]
+flush_policies = {
+    "every-frame": dict(flush_frames=1),
+    "every-16-frames": dict(flush_frames=16),
+    "every-0.5s": dict(flush_frames=None, flush_interval=0.5),
+}
+
+
+def stage_result(stage, frames, samples_per_frame, frame_size, elapsed):
+    elapsed = max(elapsed, 1e-12)
+    return {
+        "stage": stage,
+        "frames": frames,
+        "frames_per_sec": frames / elapsed,
+        "mb_per_sec": frames * frame_size / elapsed / 1e6,
+        "ns_per_sample": elapsed * 1e9 / (frames * samples_per_frame),
+    }
+
+
+def bench_case(samples, channels, storage, policy, frames, directory):
+    quiet = contextlib.redirect_stdout(io.StringIO())
+    file_name = os.path.join(directory, "bench.hdf5")
+    samples_per_frame = samples * channels
+    results = []
+
+    with BoardSimulator(
+        samples=samples, channels=channels, speed=None, frame_pool=4, seed=0
+    ) as sim, quiet:
+        host, port = sim.address
+        daq = DAQ(
+            host,
+            port,
+            samples,
+            channels,
+            filename=file_name,
+            storage=storage,
+            **flush_policies[policy],
+        )
+
+        daq.connect()
+        buffers = []
+        start = time.perf_counter()
+        for _ in range(frames):
+            buffer = bytearray(daq.frame_size)
+            daq.download_frame(buffer)
+            buffers.append(buffer)
+        elapsed = time.perf_counter() - start
+        daq.disconnect()
+        results.append(
+            stage_result(
+                "download_frame", frames, samples_per_frame, daq.frame_size, elapsed
+            )
+        )
+
+        start = time.perf_counter()
+        unpacked = [daq.unpack_buffer(buffer) for buffer in buffers]
+        elapsed = time.perf_counter() - start
+        results.append(
+            stage_result(
+                "unpack_buffer", frames, samples_per_frame, daq.frame_size, elapsed
+            )
+        )
+
+        decode = daq.decode_codes if storage == "int32" else daq.decode_frame
+        decoded = []
+        start = time.perf_counter()
+        for words, offset in unpacked:
+            values, pll_locked, no_chip_error = decode(words, channels)
+            status = daq.frame_status(pll_locked, no_chip_error)
+            decoded.append((values, offset, status))
+        elapsed = time.perf_counter() - start
+        results.append(
+            stage_result("decode", frames, samples_per_frame, daq.frame_size, elapsed)
+        )
+
+        daq.init_hdf5()
+        start = time.perf_counter()
+        for (values, offset, status), buffer in zip(decoded, buffers):
+            daq.write_data(values, buffer, offset, status)
+        daq.close_hdf5()
+        elapsed = time.perf_counter() - start
+        results.append(
+            stage_result(
+                "write_data", frames, samples_per_frame, daq.frame_size, elapsed
+            )
+        )
+
+    # End to end: a fresh board capped at `frames` frames, drained by the
+    # pipelined client until the simulator closes the connection
+    with BoardSimulator(
+        samples=samples,
+        channels=channels,
+        speed=None,
+        frame_pool=4,
+        max_frames=frames,
+        seed=0,
+    ) as sim, contextlib.redirect_stdout(io.StringIO()):
+        host, port = sim.address
+        daq = DAQ(
+            host,
+            port,
+            samples,
+            channels,
+            filename=file_name,
+            storage=storage,
+            **flush_policies[policy],
+        )
+        daq.init_hdf5()
+        start = time.perf_counter()
+        daq.run_pipelined()
+        elapsed = time.perf_counter() - start
+        written = daq.pipeline_stats["frames_written"]
+    results.append(
+        stage_result("end_to_end", written, samples_per_frame, daq.frame_size, elapsed)
+    )
+
+    for result in results:
+        result.update(
+            samples=samples, channels=channels, storage=storage, flush_policy=policy
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark DAQ ingest throughput")
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--output", default="ingest-benchmark.json")
+    args = parser.parse_args()
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "h5py": h5py.__version__,
+        "hdf5": h5py.version.hdf5_version,
+        "frames_per_case": args.frames,
+        "results": [],
+    }
+
+    print(
+        f"{'samples':>8}{'ch':>4}{'storage':>9}{'flush policy':>17}"
+        f"{'stage':>16}{'frames/s':>11}{'MB/s':>9}{'ns/sample':>11}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        for samples, channels, storage, policy in itertools.product(
+            frame_sizes, channel_counts, storages, flush_policies
+        ):
+            for result in bench_case(
+                samples, channels, storage, policy, args.frames, directory
+            ):
+                report["results"].append(result)
+                print(
+                    f"{samples:>8}{channels:>4}{storage:>9}{policy:>17}"
+                    f"{result['stage']:>16}{result['frames_per_sec']:>11.1f}"
+                    f"{result['mb_per_sec']:>9.1f}{result['ns_per_sample']:>11.2f}"
+                )
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to '{args.output}'")
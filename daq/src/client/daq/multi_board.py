@@ -0,0 +1,267 @@
+import queue
+import selectors
+import signal
+import threading
+import time
+from daq import DAQ, Metrics
+
+"""
+Acquires from several boards in one process.
+
+One selector loop drains every board socket into that board's pool of
+frame buffers. Each board has its own DAQ instance (decode, status,
+overview and HDF5 file) and its own write thread, so a slow board or a
+slow disk only backs up its own queue. When a board runs out of free
+buffers its socket is dropped from the selector until its writer catches
+up, which pushes back on that board through TCP while the others keep
+streaming.
+
+All files of a run share a run ID, stored as the "run_id" file attribute.
+"""
+
+
+def board_filename(file_pattern: str, run_id: str, board_ip: str, port: int) -> str:
+    return file_pattern.format(
+        run_id=run_id, board=f"{board_ip.replace('.', '-')}-{port}"
+    )
+
+
+class Board:
+    def __init__(self, name: str, daq: DAQ, queue_depth: int):
+        self.name = name
+        self.daq = daq
+        self.free_q = queue.Queue()
+        for _ in range(queue_depth):
+            self.free_q.put(bytearray(daq.frame_size))
+        self.write_q = queue.Queue()
+        self.worker = None
+
+        # Frame currently being received
+        self.buffer = None
+        self.view = None
+        self.received = 0
+        self.started = 0.0
+
+        self.paused = False
+        self.closed = False
+        self.failed = False
+
+
+class MultiBoardMetrics(Metrics):
+    # Serves every board's snapshot from one endpoint
+    def __init__(self, run_id: str, boards: dict):
+        super().__init__()
+        self.run_id = run_id
+        self.boards = boards
+
+    def snapshot(self):
+        return {
+            "run_id": self.run_id,
+            "boards": {
+                name: board.daq.metrics.snapshot()
+                for name, board in self.boards.items()
+            },
+        }
+
+
+class MultiBoardDAQ:
+    def __init__(
+        self,
+        boards: list[tuple[str, int]],
+        samples: int = 1024 * 20,
+        channels: int = 4,
+        timestamp_header: int = 0,
+        run_id: str | None = None,
+        file_pattern: str = "{run_id}-{board}.hdf5",
+        queue_depth: int = 8,
+        metrics_port: int | None = None,
+        report_interval: float | None = 10.0,
+        **daq_kwargs,
+    ):
+        self.run_id = run_id or time.strftime("%Y%m%d-%H%M%S")
+        self.boards = {}
+        for board_ip, port in boards:
+            name = f"{board_ip}:{port}"
+            filename = board_filename(file_pattern, self.run_id, board_ip, port)
+            daq = DAQ(
+                board_ip,
+                port,
+                samples,
+                channels,
+                timestamp_header,
+                filename,
+                report_interval=None,
+                run_id=self.run_id,
+                **daq_kwargs,
+            )
+            self.boards[name] = Board(name, daq, queue_depth)
+
+        self.metrics = MultiBoardMetrics(self.run_id, self.boards)
+        self.metrics_port = metrics_port
+        self.report_interval = report_interval
+        self.last_report = time.monotonic()
+        self.selector = None
+
+    def _on_term(self, signum, frame):
+        raise SystemExit
+
+    def write_worker(self, board: Board):
+        daq = board.daq
+        while True:
+            try:
+                buffer = board.write_q.get(timeout=daq.flush_interval)
+            except queue.Empty:
+                # No new frames, but a time-based flush may be due
+                if not board.failed and daq.flush_due():
+                    daq.flush()
+                continue
+            if buffer is None:
+                break
+            try:
+                if not board.failed:
+                    daq.frames_in_flight = board.write_q.qsize()
+                    values, offset, status = daq.process_frame(buffer)
+                    daq.write_data(values, buffer, offset, status)
+            except Exception as e:
+                print(f"{board.name}: write worker failed: {e}")
+                board.failed = True
+            finally:
+                board.free_q.put(buffer)
+
+    def receive(self, board: Board):
+        daq = board.daq
+        if board.buffer is None:
+            try:
+                board.buffer = board.free_q.get_nowait()
+            except queue.Empty:
+                # Backpressure: stop reading this board until its writer
+                # returns a buffer; the other boards are unaffected
+                self.selector.unregister(daq.socket)
+                board.paused = True
+                daq.metrics.count("overruns")
+                return
+            board.view = memoryview(board.buffer)
+            board.received = 0
+            board.started = time.perf_counter()
+
+        try:
+            n = daq.socket.recv_into(board.view[board.received :])
+        except BlockingIOError:
+            return
+        except OSError as e:
+            print(f"{board.name}: {e}")
+            self.close_board(board)
+            return
+        if not n:
+            print(f"{board.name}: connection closed by remote.")
+            self.close_board(board)
+            return
+
+        board.received += n
+        if board.received == daq.frame_size:
+            daq.frame_received(board.started)
+            board.write_q.put(board.buffer)
+            daq.metrics.gauge("write_queue_depth", board.write_q.qsize())
+            board.buffer = None
+
+    def resume_paused(self):
+        for board in self.boards.values():
+            if board.paused and not board.closed and not board.free_q.empty():
+                self.selector.register(board.daq.socket, selectors.EVENT_READ, board)
+                board.paused = False
+
+    def close_board(self, board: Board):
+        if board.closed:
+            return
+        board.closed = True
+        if board.buffer is not None:
+            # Drop the partially received frame
+            board.free_q.put(board.buffer)
+            board.buffer = None
+        if board.daq.connected:
+            if not board.paused:
+                self.selector.unregister(board.daq.socket)
+            try:
+                board.daq.disconnect()
+            except OSError:
+                board.daq.socket.close()
+                board.daq.connected = False
+        board.write_q.put(None)
+
+    def report(self, force=False):
+        now = time.monotonic()
+        if not force and (
+            self.report_interval is None
+            or now - self.last_report < self.report_interval
+        ):
+            return
+        self.last_report = now
+
+        for name, board in self.boards.items():
+            counters = board.daq.metrics.counters
+            gauges = board.daq.metrics.gauges
+            state = "closed" if board.closed else "paused" if board.paused else "ok"
+            print(
+                f"{name}: {counters.get('frames_stored', 0)} frames stored, "
+                f"{gauges.get('frames_behind', 0)} frames behind, "
+                f"{counters.get('overruns', 0)} overruns, "
+                f"{DAQ.link_alerts(counters)} link alerts ({state})"
+            )
+
+    def run(self, stop_event=None):
+        signal.signal(signal.SIGTERM, self._on_term)
+        self.selector = selectors.DefaultSelector()
+
+        for board in self.boards.values():
+            try:
+                board.daq.connect()
+            except OSError as e:
+                # One unreachable board should not stop the others
+                print(f"{board.name}: could not connect ({e})")
+                board.closed = True
+                continue
+            board.daq.socket.setblocking(False)
+            board.daq.init_hdf5()
+            self.selector.register(board.daq.socket, selectors.EVENT_READ, board)
+            board.worker = threading.Thread(
+                target=self.write_worker,
+                args=(board,),
+                name=f"daq-write-{board.name}",
+                daemon=True,
+            )
+            board.worker.start()
+
+        if self.metrics_port is not None:
+            host, port = self.metrics.serve(port=self.metrics_port)
+            print(f"Serving metrics on http://{host}:{port}/metrics")
+
+        try:
+            while stop_event is None or not stop_event.is_set():
+                if all(board.closed for board in self.boards.values()):
+                    break
+                for key, _ in self.selector.select(timeout=0.1):
+                    self.receive(key.data)
+                for board in self.boards.values():
+                    if board.failed:
+                        self.close_board(board)
+                self.resume_paused()
+                self.report()
+
+        except KeyboardInterrupt:
+            print("\nInterrupted by user.")
+
+        except SystemExit:
+            print("\nInterrupted by terminate (SIGTERM)")
+        finally:
+            for board in self.boards.values():
+                self.close_board(board)
+            for board in self.boards.values():
+                if board.worker is not None:
+                    board.worker.join()
+                try:
+                    board.daq.close_hdf5()
+                except Exception as e:
+                    print(f"{board.name}: could not close '{board.daq.filename}': {e}")
+            self.selector.close()
+            self.report(force=True)
+            self.metrics.close()
@@ -0,0 +1,252 @@
+import argparse
+import socket
+import threading
+import time
+import numpy as np
+from daq import DAQ
+
+"""
+Stand-in for the Zynq board's port-7 streaming server (vitis/data-transfer.c).
+
+Frames follow the firmware format: an optional HEADER_SIZE-word timestamp
+header (ticks hi, ticks lo) followed by samples * channels little-endian
+uint32 words, channel-interleaved. Each word holds the 24-bit code in bits
+31:8, the PLL-lock flag in bit 6 and the no-chip-error flag in bit 7.
+
+speed scales the frame rate relative to real time at the configured ODR
+(None sends as fast as the client reads). Faults are injected per frame
+with the *_rate probabilities.
+"""
+
+PLL_LOCK_BIT = 0x00000040
+NO_CHIP_ERROR_BIT = 0x00000080
+WAVEFORMS = ("sine", "ramp", "noise")
+
+
+class BoardSimulator:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        samples: int = 1024 * 20,
+        channels: int = 4,
+        timestamp_header: int = 0,
+        odr: float = 1e9 / 3000,
+        speed: float | None = 1.0,
+        waveform: str = "sine",
+        amplitude: float = 2.0,
+        frequency: float = 1000.0,
+        noise: float = 1e-4,
+        frame_pool: int = 0,
+        pll_unlock_rate: float = 0.0,
+        chip_error_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_sec: float = 0.5,
+        max_frames: int | None = None,
+        seed: int | None = None,
+    ):
+        if waveform not in WAVEFORMS:
+            raise ValueError(f"Unknown waveform '{waveform}'")
+
+        self.host = host
+        self.port = port
+        self.samples = samples
+        self.channels = channels
+        self.timestamp_header = timestamp_header
+        self.odr = odr
+        self.speed = speed
+        self.waveform = waveform
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.noise = noise
+        self.frame_pool = frame_pool
+        self.pll_unlock_rate = pll_unlock_rate
+        self.chip_error_rate = chip_error_rate
+        self.drop_rate = drop_rate
+        self.stall_rate = stall_rate
+        self.stall_sec = stall_sec
+        self.max_frames = max_frames
+        self.rng = np.random.default_rng(seed)
+
+        self.server = None
+        self.thread = None
+        self.stopped = threading.Event()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.sample_index = 0
+
+        # Per-channel phase offsets so channels are distinguishable
+        self.phases = np.arange(channels) * np.pi / 2
+        self.pool = [self.generate_frame(k) for k in range(frame_pool)]
+
+    @property
+    def address(self):
+        return self.server.getsockname()
+
+    def generate_frame(self, frame_number: int):
+        start = frame_number * self.samples
+        t = (start + np.arange(self.samples))[:, None] / self.odr
+
+        if self.waveform == "sine":
+            volts = self.amplitude * np.sin(
+                2 * np.pi * self.frequency * t + self.phases
+            )
+        elif self.waveform == "ramp":
+            cycle = (t * self.frequency + self.phases / (2 * np.pi)) % 1.0
+            volts = self.amplitude * (2 * cycle - 1)
+        else:
+            volts = np.zeros((self.samples, self.channels))
+
+        if self.noise:
+            volts = volts + self.rng.normal(0, self.noise, volts.shape)
+
+        codes = np.clip(np.round(volts / DAQ.LSB), -(1 << 23), (1 << 23) - 1)
+        words = (codes.astype(np.int32).view(np.uint32) & 0xFFFFFF) << 8
+        words |= PLL_LOCK_BIT | NO_CHIP_ERROR_BIT
+        return words.astype("<u4")
+
+    def inject_faults(self, words):
+        if self.pll_unlock_rate and self.rng.random() < self.pll_unlock_rate:
+            words = words.copy()
+            start = self.rng.integers(self.samples)
+            words[start:, :] &= ~np.uint32(PLL_LOCK_BIT)
+        if self.chip_error_rate and self.rng.random() < self.chip_error_rate:
+            words = words.copy()
+            start = self.rng.integers(self.samples)
+            stop = min(self.samples, start + self.rng.integers(1, 64))
+            words[start:stop, :] &= ~np.uint32(NO_CHIP_ERROR_BIT)
+        return words
+
+    def build_frame(self, frame_number: int):
+        if self.pool:
+            words = self.pool[frame_number % len(self.pool)]
+        else:
+            words = self.generate_frame(frame_number)
+        words = self.inject_faults(words)
+
+        if not self.timestamp_header:
+            return words.tobytes()
+
+        # XTime ticks at the first sample of the frame, split hi/lo
+        ticks = int(self.sample_index / self.odr * DAQ.TICKS_PER_SECOND)
+        header = np.zeros(self.timestamp_header, dtype="<u4")
+        header[0] = ticks >> 32
+        if self.timestamp_header > 1:
+            header[1] = ticks & 0xFFFFFFFF
+        return header.tobytes() + words.tobytes()
+
+    def stream(self, conn):
+        frame_period = self.samples / self.odr
+        next_send = time.perf_counter()
+        frame_number = 0
+
+        while not self.stopped.is_set():
+            if self.max_frames is not None and self.frames_sent >= self.max_frames:
+                break
+
+            if self.drop_rate and self.rng.random() < self.drop_rate:
+                # The frame is lost on the board; its samples still elapse
+                self.frames_dropped += 1
+            else:
+                if self.stall_rate and self.rng.random() < self.stall_rate:
+                    time.sleep(self.stall_sec)
+                conn.sendall(self.build_frame(frame_number))
+                self.frames_sent += 1
+
+            frame_number += 1
+            self.sample_index += self.samples
+
+            if self.speed:
+                next_send += frame_period / self.speed
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def serve(self):
+        # Like the firmware, serve one client at a time
+        while not self.stopped.is_set():
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                break
+            with conn:
+                try:
+                    self.stream(conn)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            if self.max_frames is not None and self.frames_sent >= self.max_frames:
+                break
+
+    def start(self):
+        self.server = socket.create_server((self.host, self.port))
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.serve, name="board-simulator", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.server is not None:
+            # shutdown wakes a thread blocked in accept(); close alone may not
+            try:
+                self.server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server.close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate the AD4134 FMC board")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7007)
+    parser.add_argument("--samples", type=int, default=1024 * 20)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--timestamp-header", type=int, default=0)
+    parser.add_argument("--odr", type=float, default=1e9 / 3000)
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="0 sends as fast as possible"
+    )
+    parser.add_argument("--waveform", choices=WAVEFORMS, default="sine")
+    parser.add_argument("--frequency", type=float, default=1000.0)
+    parser.add_argument("--frame-pool", type=int, default=0)
+    parser.add_argument("--pll-unlock-rate", type=float, default=0.0)
+    parser.add_argument("--chip-error-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    simulator = BoardSimulator(
+        host=args.host,
+        port=args.port,
+        samples=args.samples,
+        channels=args.channels,
+        timestamp_header=args.timestamp_header,
+        odr=args.odr,
+        speed=args.speed or None,
+        waveform=args.waveform,
+        frequency=args.frequency,
+        frame_pool=args.frame_pool,
+        pll_unlock_rate=args.pll_unlock_rate,
+        chip_error_rate=args.chip_error_rate,
+        drop_rate=args.drop_rate,
+        stall_rate=args.stall_rate,
+    )
+    simulator.start()
+    print(f"Simulating board on {simulator.address[0]}:{simulator.address[1]}")
+    try:
+        simulator.thread.join()
+    except KeyboardInterrupt:
+        print("\nInterrupted by user.")
+    finally:
+        simulator.stop()
@@ -0,0 +1,103 @@
+import os
+import tempfile
+import time
+import numpy as np
+from daq import DAQ
+
+"""
+Compares capture file size and write throughput for each storage mode.
+
+Frames are synthesised in memory (a slow sine plus noise on every channel,
+with the PLL-lock and no-chip-error bits set) and pushed through the same
+decode and write_data path DAQ.run uses, so only the HDF5 side is measured.
+"""
+
+samples = 1024 * 20
+channels = 4
+frames = 100
+flush_frames = 10
+
+configs = [
+    dict(storage="float32"),
+    dict(storage="float32", shuffle=True, compression="gzip", compression_opts=4),
+    dict(storage="int32"),
+    dict(storage="int32", shuffle=True, compression="lzf"),
+    dict(storage="int32", shuffle=True, compression="gzip", compression_opts=1),
+    dict(storage="int32", shuffle=True, compression="gzip", compression_opts=4),
+    dict(storage="int32", shuffle=True, compression="gzip", compression_opts=9),
+]
+
+
+def synthesize_frames(n_frames):
+    rng = np.random.default_rng(0)
+    t = np.arange(n_frames * samples)
+    out = []
+    for k in range(n_frames):
+        sl = t[k * samples : (k + 1) * samples, None]
+        signal = 2.0 * np.sin(2 * np.pi * sl / 50_000 + np.arange(channels))
+        noise = rng.normal(0, 1e-4, size=(samples, channels))
+        codes = np.round((signal + noise) / DAQ.LSB).astype(np.int32)
+        words = (codes.astype(np.uint32) << 8) | 0xC0
+        out.append(words.ravel())
+    return out
+
+
+def describe(config):
+    label = config["storage"]
+    if config.get("shuffle"):
+        label += "+shuffle"
+    if config.get("compression"):
+        label += f"+{config['compression']}"
+        if config.get("compression_opts") is not None:
+            label += f"({config['compression_opts']})"
+    return label
+
+
+def run_benchmark(config, words_per_frame, directory):
+    file_name = os.path.join(directory, f"{describe(config)}.hdf5")
+    daq = DAQ(
+        samples=samples,
+        channels=channels,
+        filename=file_name,
+        flush_frames=flush_frames,
+        # The overview pyramid would add to every file; compare "data" alone
+        overview_factors=(),
+        **config,
+    )
+    daq.init_hdf5()
+
+    start = time.perf_counter()
+    for words in words_per_frame:
+        values, pll_locked, no_chip_error = (
+            daq.decode_codes(words, channels)
+            if daq.storage == "int32"
+            else daq.decode_frame(words, channels)
+        )
+        daq.write_data(values, None, 0, daq.frame_status(pll_locked, no_chip_error))
+    daq.close_hdf5()
+    elapsed = time.perf_counter() - start
+
+    total_samples = len(words_per_frame) * samples * channels
+    raw_mb = total_samples * DAQ.BYTES_PER_SAMPLE / 1e6
+    return {
+        "config": describe(config),
+        "bytes_per_sample": os.path.getsize(file_name) / total_samples,
+        "write_mb_s": raw_mb / elapsed,
+    }
+
+
+if __name__ == "__main__":
+    words_per_frame = synthesize_frames(frames)
+    print(
+        f"{frames} frames x {samples} samples x {channels} channels "
+        f"(flush every {flush_frames} frames)"
+    )
+    print(f"{'config':<32}{'bytes/sample':>14}{'write MB/s':>14}")
+    with tempfile.TemporaryDirectory() as directory:
+        for config in configs:
+            result = run_benchmark(config, words_per_frame, directory)
+            print(
+                f"{result['config']:<32}"
+                f"{result['bytes_per_sample']:>14.3f}"
+                f"{result['write_mb_s']:>14.1f}"
+            )
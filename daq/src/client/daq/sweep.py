@@ -0,0 +1,353 @@
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import h5py
+import numpy as np
+
+"""
+DAC linearity sweep over a single DAQ connection.
+
+A receiver thread keeps draining the socket, so neither the kernel nor the
+board ever holds a backlog of old samples. For every DAC code the engine
+sets the DAC, discards the frames that arrived before the new value could
+have reached every sample of a frame, then reads frames until the DAC
+channel settles: settle_frames consecutive frame means
+agreeing within settle_sigma standard errors (or settle_tolerance volts,
+whichever is larger). The mean and standard error of the last settled frame
+are one point of the sweep.
+
+Setting the next code is a slow serial round trip, so it runs on a worker
+thread while the current point is processed and written. Points are written
+in batches of batch_points rows, or every flush_interval seconds so the
+dashboard keeps up.
+
+The codes come from a SweepPlan, which converts, validates and orders the
+whole table before the run, so the sweep loop does no per-step conversion.
+
+"data" holds one (DAC voltage, mean ADC voltage, standard error) row per
+point, "status" the matching STATUS_DTYPE record and "plan" the planned
+code and expected voltage of every point.
+"""
+
+# "given" keeps the order the codes were listed in, "updown" sweeps up and
+# back down to expose hysteresis and "random" separates drift from
+# nonlinearity
+ORDERS = ("given", "ascending", "descending", "updown", "random")
+PLAN_DTYPE = np.dtype([("code", "<u4"), ("voltage", "<f8")])
+
+# Frames rejected before each accepted point (bad PLL/chip status on the
+# DAC channel), stale frames skipped after setting the DAC, frames read
+# until the channel settled and whether it did within max_settle_frames
+STATUS_DTYPE = np.dtype(
+    [
+        ("rejected_frames", "<i4"),
+        ("pll_unlocked", "<i4"),
+        ("chip_errors", "<i4"),
+        ("stale_frames", "<i4"),
+        ("settle_frames", "<i4"),
+        ("settled", "i1"),
+    ]
+)
+
+
+class SweepPlan:
+    # DAC codes in the order they are visited, with their expected voltages
+    def __init__(self, codes, voltages):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.voltages = np.asarray(voltages, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_codes(cls, dac, codes, order="given", seed=None):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown sweep order '{order}'")
+        codes = np.asarray(codes, dtype=np.int64)
+        valid = dac.valid_codes(codes)
+        if not valid.all():
+            print(
+                f"Skipping {np.count_nonzero(~valid)} codes outside "
+                f"{dac.voltage_range} V"
+            )
+            codes = codes[valid]
+        voltages = dac.codes_to_voltages(codes)
+
+        if order == "random":
+            index = np.random.default_rng(seed).permutation(len(codes))
+        elif order != "given":
+            index = np.argsort(voltages, kind="stable")
+            if order == "descending":
+                index = index[::-1]
+            elif order == "updown":
+                index = np.concatenate([index, index[-2::-1]])
+        if order != "given":
+            codes, voltages = codes[index], voltages[index]
+        return cls(codes, voltages)
+
+    @classmethod
+    def from_voltages(cls, dac, voltages, order="given", seed=None, clip=False):
+        # With clip, voltages outside the DAC's range are clipped to it
+        codes = dac.voltages_to_codes(voltages, clip=clip)
+        return cls.from_codes(dac, codes, order, seed)
+
+    def table(self):
+        table = np.empty(len(self), dtype=PLAN_DTYPE)
+        table["code"] = self.codes
+        table["voltage"] = self.voltages
+        return table
+
+
+class DacSweep:
+    def __init__(
+        self,
+        daq,
+        dac,
+        dac_channel: int = 1,
+        filename: str = "dac-test.hdf5",
+        settle_frames: int = 2,
+        settle_sigma: float = 4.0,
+        settle_tolerance: float = 1e-5,
+        max_settle_frames: int = 50,
+        batch_points: int = 256,
+        flush_interval: float | None = 1.0,
+        queue_frames: int = 8,
+    ):
+        self.daq = daq
+        self.dac = dac
+        self.dac_channel = dac_channel
+        self.filename = filename
+        self.settle_frames = max(1, settle_frames)
+        self.settle_sigma = settle_sigma
+        self.settle_tolerance = settle_tolerance
+        self.max_settle_frames = max_settle_frames
+        self.batch_points = batch_points
+        self.flush_interval = flush_interval
+
+        # Received frames waiting to be measured, as (arrival time, buffer).
+        # Frames nobody is waiting for are dropped once all queue_frames
+        # buffers are in use.
+        self.free_q = queue.Queue()
+        for _ in range(queue_frames):
+            self.free_q.put(bytearray(self.daq.frame_size))
+        self.frame_q = queue.Queue()
+        # First frame after the stale ones, measured next
+        self.held = None
+        self.stopped = threading.Event()
+        self.receiver = None
+
+        self.file = None
+        self.points = []
+        self.statuses = []
+        self.last_write = time.monotonic()
+        # DAC commands run here so they overlap with processing
+        self.dac_worker = None
+
+    def open(self, plan: SweepPlan):
+        self.file = h5py.File(self.filename, "w", libver="latest")
+        self.file.create_dataset("plan", data=plan.table())
+        self.data_ds = self.file.create_dataset(
+            "data",
+            shape=(0, 3),
+            maxshape=(None, 3),
+            chunks=(self.batch_points, 3),
+            dtype="float32",
+        )
+        self.status_ds = self.file.create_dataset(
+            "status",
+            shape=(0,),
+            maxshape=(None,),
+            chunks=(self.batch_points,),
+            dtype=STATUS_DTYPE,
+        )
+        self.data_ds.attrs["dac_channel"] = self.dac_channel
+        self.file.swmr_mode = True
+
+        self.daq.connect()
+        self.stopped.clear()
+        self.receiver = threading.Thread(
+            target=self.receive, name="sweep-receive", daemon=True
+        )
+        self.receiver.start()
+        self.dac_worker = ThreadPoolExecutor(1, thread_name_prefix="dac")
+
+    def close(self):
+        if self.dac_worker is not None:
+            self.dac_worker.shutdown()
+            self.dac_worker = None
+        if self.receiver is not None:
+            # The board streams continuously, so the receiver finishes its
+            # frame and stops; disconnecting wakes it if the board went quiet
+            self.stopped.set()
+            self.receiver.join(timeout=1.0)
+            if self.daq.connected:
+                self.daq.disconnect()
+            self.receiver.join()
+            self.receiver = None
+        elif self.daq.connected:
+            self.daq.disconnect()
+        if self.file is not None:
+            self.write_batch()
+            self.file.close()
+            self.file = None
+
+    def receive(self):
+        try:
+            while not self.stopped.is_set():
+                try:
+                    buffer = self.free_q.get_nowait()
+                except queue.Empty:
+                    try:
+                        # Nobody is measuring; drop the oldest frame
+                        buffer = self.frame_q.get_nowait()[1]
+                    except queue.Empty:
+                        try:
+                            buffer = self.free_q.get(timeout=0.1)
+                        except queue.Empty:
+                            continue
+                if self.daq.download_frame(buffer) is None:
+                    break
+                self.frame_q.put((time.perf_counter(), buffer))
+        except OSError as e:
+            if not self.stopped.is_set():
+                print(f"Receive failed: {e}")
+        finally:
+            self.frame_q.put(None)
+
+    def set_code(self, code: int, voltage: float):
+        # Runs on dac_worker. Returns the DAC voltage (read back if verified)
+        # and the time it had taken effect by.
+        voltage = self.dac.apply_code(code, voltage)
+        return voltage, time.perf_counter()
+
+    def submit_next(self, steps):
+        step = next(steps, None)
+        if step is None:
+            return None
+        return step[0], self.dac_worker.submit(self.set_code, *step)
+
+    def next_frame(self):
+        if self.held is not None:
+            item, self.held = self.held, None
+            return item
+        item = self.frame_q.get()
+        if item is None:
+            # Keep the end marker for any later caller
+            self.frame_q.put(None)
+            raise ConnectionError("Connection closed by board")
+        return item
+
+    def read_frame(self):
+        _, buffer = self.next_frame()
+        try:
+            self.daq.frame_count += 1
+            words = self.daq.unpack_buffer(buffer)[0]
+            frame, pll_locked, no_chip_error = self.daq.decode_frame(
+                words, self.daq.channels
+            )
+        finally:
+            self.free_q.put(buffer)
+        channel = [self.dac_channel]
+        status = self.daq.frame_status(
+            pll_locked[:, channel], no_chip_error[:, channel]
+        )
+        return frame[:, self.dac_channel].astype(np.float64), status
+
+    def skip_stale(self, changed: float) -> int:
+        # A frame that completed less than a frame period after the DAC
+        # changed holds samples from before the change. Frames delayed in
+        # transit are caught by the settling check.
+        after = changed + self.daq.frame_period
+        stale = 0
+        while True:
+            arrived, buffer = self.next_frame()
+            if arrived >= after:
+                self.held = (arrived, buffer)
+                return stale
+            self.free_q.put(buffer)
+            stale += 1
+
+    def agree(self, means) -> bool:
+        for (m0, se0), (m1, se1) in zip(means, means[1:]):
+            limit = max(self.settle_tolerance, self.settle_sigma * math.hypot(se0, se1))
+            if abs(m1 - m0) > limit:
+                return False
+        return True
+
+    def measure(self):
+        status = np.zeros((), dtype=STATUS_DTYPE)
+        means = []
+        frames = 0
+        while frames < self.max_settle_frames:
+            readings, frame_status = self.read_frame()
+            frames += 1
+            if frame_status["first_bad"] >= 0:
+                status["rejected_frames"] += 1
+                status["pll_unlocked"] += frame_status["pll_unlocked"]
+                status["chip_errors"] += frame_status["chip_errors"]
+                self.daq.report_status(frame_status)
+                # Settling starts over after a bad frame
+                means = []
+                continue
+
+            se = readings.std(ddof=1) / math.sqrt(len(readings))
+            means = means[1 - self.settle_frames :] + [(readings.mean(), se)]
+            if len(means) == self.settle_frames and self.agree(means):
+                status["settled"] = 1
+                break
+
+        status["settle_frames"] = frames
+        mean, se = means[-1] if means else (math.nan, math.nan)
+        return mean, se, status
+
+    def add_point(self, voltage, mean, se, status):
+        self.points.append((voltage, mean, se))
+        self.statuses.append(status)
+        if len(self.points) >= self.batch_points or (
+            self.flush_interval is not None
+            and time.monotonic() - self.last_write >= self.flush_interval
+        ):
+            self.write_batch()
+
+    def write_batch(self):
+        self.last_write = time.monotonic()
+        if not self.points:
+            return
+        n = self.data_ds.shape[0]
+        new_n = n + len(self.points)
+        # Status first, so a reader that sees a data row also has its status
+        self.status_ds.resize(new_n, axis=0)
+        self.status_ds[n:new_n] = np.stack(self.statuses)
+        self.data_ds.resize(new_n, axis=0)
+        self.data_ds[n:new_n] = np.array(self.points, dtype=np.float32)
+        self.file.flush()
+        self.points = []
+        self.statuses = []
+
+    def run(self, plan):
+        # plan is a SweepPlan or a sequence of DAC codes
+        if not isinstance(plan, SweepPlan):
+            plan = SweepPlan.from_codes(self.dac, plan)
+        self.open(plan)
+        try:
+            steps = zip(plan.codes.tolist(), plan.voltages.tolist())
+            pending = self.submit_next(steps)
+            while pending is not None:
+                code, future = pending
+                voltage, changed = future.result()
+                stale = self.skip_stale(changed)
+                mean, se, status = self.measure()
+                status["stale_frames"] = stale
+
+                # Move the DAC on while this point is recorded
+                pending = self.submit_next(steps)
+                self.add_point(voltage, mean, se, status)
+                print(
+                    f"{hex(code)}: {voltage:.6f} V -> {mean:.6f} V "
+                    f"(SE {se:.2e}, {status['settle_frames']} frames"
+                    f"{'' if status['settled'] else ', not settled'})"
+                )
+        finally:
+            self.close()
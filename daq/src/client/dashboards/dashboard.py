@@ -1,16 +1,32 @@
-from dash import Dash, dcc, html, Input, Output, callback, exceptions
+import os
+import sys
+from dash import Dash, dcc, html, Input, Output, State, callback, exceptions, no_update
 import dash_daq as daq
 import plotly.express as px
 import h5py
-from Plotting import Live_View, Overview
+
+# Plotting and Reader live in client/utils and import each other by bare
+# name
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utils")
+)
+from Plotting import FigureCache, Live_View, Overview
 
 ######################
 #       Config       #
 ######################
 
 
-def create_dashboard(file_name="test.hdf5"):
+def create_dashboard(file_name="test.hdf5", live_ring=None):
     app = Dash(__name__, suppress_callback_exceptions=True)
+    live_view = Live_View(file_name, live_ring=live_ring)
+    overview = Overview(file_name)
+
+    figures = FigureCache()
+    figures.add("live", live_view.extent, live_view.live_frame)
+    figures.add(
+        "overview", overview.extent, lambda previous: overview.create_overview_plots()
+    )
 
     app.layout = html.Div(
         [
@@ -47,6 +63,8 @@ def create_dashboard(file_name="test.hdf5"):
                 [
                     html.P("Test 1"),
                     dcc.Graph(id="live-view-graphs"),
+                    # Last sample index this browser tab has plotted
+                    dcc.Store(id="live-view-cursor"),
                     dcc.Interval(
                         id="live-view-interval", interval=1 * 1000, n_intervals=0
                     ),
@@ -55,12 +73,25 @@ def create_dashboard(file_name="test.hdf5"):
 
     @app.callback(
         Output("live-view-graphs", "figure"),
+        Output("live-view-graphs", "extendData"),
+        Output("live-view-cursor", "data"),
         Input("live-view-interval", "n_intervals", allow_optional=True),
+        State("live-view-cursor", "data"),
         prevent_initial_call=True,
     )
-    def render_live_view(n_intervals):
-        live_view = Live_View(file_name)
-        return live_view.create_live_plot_aggregate()
+    def render_live_view(n_intervals, cursor):
+        frame = figures.get("live", timeout=5)
+        if frame is None:
+            raise exceptions.PreventUpdate
+        # Only newly acquired points are sent once the figure exists
+        figure, extend_data, cursor = live_view.stream_from(frame, cursor)
+        if figure is None and extend_data is None:
+            raise exceptions.PreventUpdate
+        return (
+            no_update if figure is None else figure,
+            no_update if extend_data is None else extend_data,
+            cursor,
+        )
 
     @app.callback(
         Output("overview-graphs", "figure"),
@@ -68,10 +99,17 @@ def create_dashboard(file_name="test.hdf5"):
         prevent_initial_call=True,
     )
     def render_overview(n_intervals):
-        overview = Overview(file_name, 1000)
-        return overview.create_overview_plots()
+        figure = figures.get("overview", timeout=5)
+        if figure is None:
+            raise exceptions.PreventUpdate
+        return figure
 
-    app.run(debug=False, port=8051)
+    figures.start()
+    try:
+        app.run(debug=False, port=8051)
+    finally:
+        figures.stop()
+        overview.close()
 
 
 if __name__ == "__main__":
@@ -1,8 +1,16 @@
+import os
+import sys
 from dash import Dash, dcc, html, Input, Output, callback, exceptions
 import dash_daq as daq
 import plotly.express as px
 import h5py
-from Plotting import Live_View, Overview, DacTestLiveView
+
+# Plotting and Reader live in client/utils and import each other by bare
+# name
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "utils")
+)
+from Plotting import FigureCache, Live_View, Overview, DacTestLiveView
 
 ######################
 #       Config       #
@@ -12,6 +20,14 @@ file_name = "dac-test.hdf5"
 
 
 app = Dash(__name__, suppress_callback_exceptions=True)
+live_view = DacTestLiveView(file_name)
+overview = Overview(file_name)
+
+figures = FigureCache()
+figures.add("live", live_view.extent, lambda previous: live_view.create_live_plots())
+figures.add(
+    "overview", overview.extent, lambda previous: overview.create_overview_plots()
+)
 
 app.layout = html.Div(
     [
@@ -55,8 +71,10 @@ def render_dashboard_content(tab):
     prevent_initial_call=True,
 )
 def render_live_view(n_intervals):
-    live_view = DacTestLiveView(file_name)
-    return live_view.create_live_plots()
+    figure = figures.get("live", timeout=5)
+    if figure is None:
+        raise exceptions.PreventUpdate
+    return figure
 
 
 @app.callback(
@@ -65,9 +83,16 @@ def render_live_view(n_intervals):
     prevent_initial_call=True,
 )
 def render_overview(n_intervals):
-    overview = Overview(file_name, 1000)
-    return overview.create_overview_plots()
+    figure = figures.get("overview", timeout=5)
+    if figure is None:
+        raise exceptions.PreventUpdate
+    return figure
 
 
 if __name__ == "__main__":
-    app.run(debug=False)
+    figures.start()
+    try:
+        app.run(debug=False)
+    finally:
+        figures.stop()
+        overview.close()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The client modules import each other by bare name, as when they are run
+# from their own directories
+client = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+for directory in ("dac", "utils", "daq"):
+    sys.path.insert(0, os.path.abspath(os.path.join(client, directory)))
@@ -0,0 +1,91 @@
+import queue
+import time
+import pytest
+from dac import CommandChannel
+
+"""
+CommandChannel against a fake serial port that delivers the firmware's
+replies in scripted chunks.
+"""
+
+# Reply to "drw 1 0x100" (prompt only) then to two "drr 1" reads
+REPLIES = b"\r\n> Register 0x1 = 0x100\r\n> Register 0x1 = 0x200\r\n> "
+EXPECTED = [None, "Register 0x1 = 0x100", "Register 0x1 = 0x200"]
+
+
+class FakePort:
+    def __init__(self):
+        self.timeout = None
+        self.chunks = queue.Queue()
+        self.written = []
+
+    def feed(self, *chunks):
+        for chunk in chunks:
+            self.chunks.put(chunk)
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    def read(self, size=1):
+        try:
+            return self.chunks.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+
+    def write(self, data):
+        self.written.append(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        while not self.chunks.empty():
+            self.chunks.get_nowait()
+
+
+def split(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.fixture
+def channel():
+    port = FakePort()
+    channel = CommandChannel(port, timeout=0.5).start()
+    yield port, channel
+    channel.close()
+
+
+@pytest.mark.parametrize(
+    "chunks",
+    [[REPLIES], split(REPLIES, 1), split(REPLIES, 7), [REPLIES[:3], REPLIES[3:]]],
+    ids=["one-read", "bytewise", "7-byte-reads", "split-after-prompt"],
+)
+def test_pipelined_replies(channel, chunks):
+    port, channel = channel
+    futures = [
+        channel.submit("drw 1 0x100\n"),
+        channel.submit("drr 1\n"),
+        channel.submit("drr 1\n"),
+    ]
+    port.feed(*chunks)
+    assert [future.result(timeout=2) for future in futures] == EXPECTED
+
+
+def test_prompt_on_connect_is_ignored(channel):
+    port, channel = channel
+    port.feed(b"\r\n> ")
+    time.sleep(0.05)
+    future = channel.submit("drr 1\n")
+    port.feed(b"\r\nRegister 0x1 = 0x100\r\n> ")
+    assert future.result(timeout=2) == "Register 0x1 = 0x100"
+
+
+def test_missing_prompt_times_out(channel):
+    port, channel = channel
+    first = channel.submit("drr 1\n")
+    second = channel.submit("drr 1\n")
+    with pytest.raises(TimeoutError):
+        first.result(timeout=2)
+    with pytest.raises(TimeoutError):
+        second.result(timeout=2)
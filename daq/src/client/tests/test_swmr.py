@@ -0,0 +1,148 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from Reader import Reader, TailReader
+
+"""
+Cross-process SWMR stress test: a DAQ writes a simulated capture in a
+child process, flushing every frame, while this process follows it. No
+row a reader is handed may still be unwritten (all zeros).
+"""
+
+DAQ_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "daq")
+SAMPLES = 4096
+CHANNELS = 4
+FRAMES = 1500
+
+WRITER = """
+import sys
+from daq import DAQ
+from simulator import BoardSimulator
+
+file_name, rotate_interval = sys.argv[1], float(sys.argv[2]) or None
+with BoardSimulator(
+    samples={samples}, channels={channels}, speed=None, max_frames={frames}, seed=1
+) as sim:
+    daq = DAQ(
+        *sim.address,
+        {samples},
+        {channels},
+        filename=file_name,
+        flush_frames=1,
+        report_interval=None,
+        rotate_interval=rotate_interval,
+    )
+    daq.init_hdf5()
+    daq.run_pipelined()
+""".format(samples=SAMPLES, channels=CHANNELS, frames=FRAMES)
+
+
+def start_writer(file_name, rotate_interval):
+    return subprocess.Popen(
+        [sys.executable, "-c", WRITER, file_name, str(rotate_interval or 0)],
+        cwd=DAQ_DIR,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def zero_rows(block):
+    return int(np.count_nonzero(np.all(block == 0, axis=1)))
+
+
+@pytest.mark.parametrize("rotate_interval", [None, 0.5])
+def test_tail_reader_sees_only_written_rows(tmp_path, rotate_interval):
+    file_name = str(tmp_path / "stress.hdf5")
+    writer = start_writer(file_name, rotate_interval)
+    follow = file_name
+    if rotate_interval:
+        follow = str(tmp_path / "stress.manifest.json")
+
+    reader = TailReader(follow)
+    end = 0
+    polls = 0
+    try:
+        while True:
+            done = writer.poll() is not None
+            indices, data = reader.poll()
+            if len(indices):
+                new = data[max(0, end - int(indices[0])) :]
+                assert zero_rows(new) == 0, f"unwritten rows after row {end}"
+                end = int(indices[-1]) + 1
+                polls += 1
+            if done:
+                break
+    finally:
+        writer.kill()
+        writer.wait()
+        reader.close()
+
+    assert writer.returncode == 0
+    assert polls > 1
+    assert end == FRAMES * SAMPLES
+
+
+def test_reader_read_range_sees_only_written_rows(tmp_path):
+    file_name = str(tmp_path / "stress.hdf5")
+    writer = start_writer(file_name, None)
+    reader = Reader(file_name)
+    end = 0
+    try:
+        while writer.poll() is None:
+            if reader.h5 is None:
+                try:
+                    reader.open()
+                except (OSError, KeyError):
+                    continue
+            indices, block = reader.read_range(start=end)
+            assert zero_rows(block) == 0, f"unwritten rows after row {end}"
+            if len(indices):
+                end = int(indices[-1]) + 1
+        _, block = reader.read_range()
+    finally:
+        writer.kill()
+        writer.wait()
+        if reader.h5 is not None:
+            reader.close()
+
+    assert writer.returncode == 0
+    assert block.shape == (FRAMES * SAMPLES, CHANNELS)
+    assert zero_rows(block) == 0
+
+
+@pytest.mark.parametrize("rotate_interval", [None, 0.5])
+def test_views_share_one_handle(tmp_path, rotate_interval):
+    # The live view and the overview follow the same file in one process
+    from Plotting import Live_View, Overview
+
+    file_name = str(tmp_path / "stress.hdf5")
+    writer = start_writer(file_name, rotate_interval)
+    if rotate_interval:
+        file_name = str(tmp_path / "stress.manifest.json")
+    live_view = Live_View(file_name)
+    overview = Overview(file_name)
+    rows = []
+    try:
+        while True:
+            done = writer.poll() is not None
+            try:
+                live_view.extent()
+                rows.append(overview.extent()[1])
+            except (OSError, KeyError):
+                # Until the writer has the file open in SWMR mode
+                if rows:
+                    raise
+                continue
+            overview.create_overview_plots()
+            if done:
+                break
+    finally:
+        writer.kill()
+        writer.wait()
+        live_view.reader.close()
+        overview.close()
+
+    assert writer.returncode == 0
+    assert rows == sorted(rows)
+    assert rows[-1] == FRAMES * SAMPLES
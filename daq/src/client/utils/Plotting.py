@@ -2,52 +2,230 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
 import numpy as np
-from scipy.signal import decimate
-from Reader import Reader, DAC_Reader
+import threading
+import time
+from Reader import Reader, TailReader, valid_rows
+from live_ring import LiveRingReader
 import matplotlib.pyplot as plt
 
 
+def minmax_indices(y, max_points):
+    # M4 downsampling: keep the first, min, max and last sample of each of
+    # max_points // 4 equal buckets, so every peak and glitch survives
+    n = len(y)
+    buckets = max(1, max_points // 4)
+    if n <= max_points or n < 4 * buckets:
+        return np.arange(n)
+
+    size = -(-n // buckets)
+    padded = np.empty(buckets * size, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    blocks = padded.reshape(buckets, size)
+
+    starts = np.arange(buckets) * size
+    picks = np.stack(
+        [
+            starts,
+            starts + blocks.argmin(axis=1),
+            starts + blocks.argmax(axis=1),
+            np.minimum(starts + size - 1, n - 1),
+        ],
+        axis=1,
+    )
+    return np.unique(np.minimum(picks, n - 1))
+
+
+def lttb_indices(x, y, max_points):
+    # Largest-Triangle-Three-Buckets. Each bucket keeps the point forming
+    # the largest triangle with the previous pick and the next bucket's mean
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+
+    # Mean of each bucket, used as the third triangle vertex
+    counts = np.diff(edges)
+    x_mean = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    y_mean = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    x_mean = np.append(x_mean[1:], x[-1])
+    y_mean = np.append(y_mean[1:], y[-1])
+
+    picks = np.empty(max_points, dtype=np.int64)
+    picks[0] = 0
+    picks[-1] = n - 1
+    prev = 0
+    for b in range(max_points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs(
+            (x[prev] - x_mean[b]) * (y[lo:hi] - y[prev])
+            - (x[prev] - x[lo:hi]) * (y_mean[b] - y[prev])
+        )
+        prev = lo + int(area.argmax())
+        picks[b + 1] = prev
+    return picks
+
+
+def downsample(x, y, max_points, mode="minmax"):
+    if max_points is None:
+        return x, y
+    if mode == "lttb":
+        idx = lttb_indices(x, y, max_points)
+    elif mode == "minmax":
+        idx = minmax_indices(y, max_points)
+    else:
+        raise ValueError(f"Unknown downsampling mode '{mode}'")
+    return x[idx], y[idx]
+
+
+def polled_extent(view):
+    # FigureCache key of a view following a TailReader: the newest polled
+    # row and the view parameters
+    indices, _ = view.reader.poll()
+    end = int(indices[-1]) + 1 if len(indices) else 0
+    return (view.file_name, end, view.max_points, view.mode)
+
+
+class FigureCache:
+    # Figures shared by every dashboard callback and browser tab. One
+    # background thread checks each figure's extent key (file, rows, view
+    # parameters) and rebuilds the figure only when the key changes, so
+    # callbacks just return the latest result and concurrent viewers never
+    # repeat the work. Figures nobody asked for in the last `idle` seconds
+    # are not kept up to date.
+    def __init__(self, interval=0.5, idle=30.0):
+        self.interval = interval
+        self.idle = idle
+        self.entries = {}
+        self.changed = threading.Condition()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, name, extent, build):
+        # extent() must be cheap and return a hashable key; build(previous)
+        # gets the previous value and is only called when the key changes
+        self.entries[name] = dict(
+            extent=extent, build=build, key=None, value=None, wanted=None
+        )
+
+    def refresh(self):
+        now = time.monotonic()
+        for name, entry in self.entries.items():
+            if entry["wanted"] is None or now - entry["wanted"] > self.idle:
+                continue
+            try:
+                key = entry["extent"]()
+                if key == entry["key"]:
+                    continue
+                value = entry["build"](entry["value"])
+            except (FileNotFoundError, KeyError):
+                # Acquisition has not created the file yet
+                continue
+            except Exception as e:
+                print(f"Could not build '{name}': {e}")
+                continue
+            with self.changed:
+                entry["key"] = key
+                entry["value"] = value
+                self.changed.notify_all()
+
+    def get(self, name, timeout=None):
+        # Latest value of `name`, waiting up to timeout for the first one.
+        # Returns None if there is none yet.
+        entry = self.entries[name]
+        entry["wanted"] = time.monotonic()
+        with self.changed:
+            if entry["value"] is None:
+                self.wake.set()
+                self.changed.wait_for(lambda: entry["value"] is not None, timeout)
+            return entry["value"]
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.refresh()
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="figure-cache", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
 class Live_View:
-    def __init__(self, file_name):
+    def __init__(
+        self,
+        file_name,
+        max_points=2000,
+        mode="minmax",
+        live_ring=None,
+        window_rows=None,
+    ):
         self.file_name = file_name
         self.subplot_rows = 2
         self.subplot_cols = 2
+        # Points per trace, roughly the pixel width of a plot
+        self.max_points = max_points
+        self.mode = mode
+        # Kept open across ticks so each refresh only reads new rows. With
+        # live_ring, the newest rows come straight from the acquisition
+        # process's shared memory and the file is only read while no
+        # acquisition is publishing.
+        self.reader = TailReader(file_name)
+        if live_ring is not None:
+            self.reader = LiveRingReader(live_ring, window_rows, fallback=self.reader)
+
+    def read_window(self, build):
+        # Ring windows are views into memory the writer keeps filling; if it
+        # lapped the window while we used it, build again from a fresh one
+        while True:
+            result = build(*self.reader.poll())
+            if self.reader.verify():
+                return result
 
     def create_live_plots(self):
-        reader = Reader(self.file_name)
-        reader.open()
-        indices, data = reader.live_view_data()
-        decimation_factor = 1
+        return self.read_window(self.live_plots_figure)
 
+    def live_plots_figure(self, indices, data):
         if data.shape[0] == 0:
-            reader.close()
             return go.Figure().update_layout(title="No data yet")
 
         fig = make_subplots(rows=self.subplot_rows, cols=self.subplot_cols)
 
         for subplot_row in range(1, self.subplot_rows + 1):
             for subplot_col in range(1, self.subplot_cols + 1):
-                downsampled_signal = decimate(
+                downsampled_indices, downsampled_signal = downsample(
+                    indices,
                     data[:, 2 * (subplot_row - 1) + (subplot_col - 1)],
-                    decimation_factor,
+                    self.max_points,
+                    self.mode,
                 )
-                downsampled_indices = indices[::decimation_factor]
                 fig.add_trace(
                     go.Scattergl(x=downsampled_indices, y=downsampled_signal),
                     row=subplot_row,
                     col=subplot_col,
                 )
-        reader.close()
         return fig
 
     def create_live_plot_aggregate(self):
-        reader = Reader(self.file_name)
-        reader.open()
-        indices, data = reader.live_view_data()
-        decimation_factor = 1
+        return self.read_window(self.aggregate_figure)
 
+    def aggregate_figure(self, indices, data):
         if data.shape[0] == 0:
-            reader.close()
             return go.Figure().update_layout(title="No data yet")
 
         fig = go.Figure()
@@ -55,8 +233,9 @@ class Live_View:
         num_traces = data.shape[1]
         for ch in range(num_traces):
 
-            downsampled_signal = decimate(data[:, ch], decimation_factor)
-            downsampled_indices = indices[::decimation_factor]
+            downsampled_indices, downsampled_signal = downsample(
+                indices, data[:, ch], self.max_points, self.mode
+            )
 
             fig.add_trace(
                 go.Scattergl(
@@ -72,81 +251,220 @@ class Live_View:
             uirevision="liveview",
         )
 
-        reader.close()
         return fig
 
+    def stream_live_plot_aggregate(self, cursor=None):
+        # Incremental counterpart of create_live_plot_aggregate for Dash's
+        # extendData. Returns (figure, extend_data, cursor). When cursor is
+        # the last sample index the browser already has, only newer rows are
+        # downsampled and sent (figure is None), and the browser trims each
+        # trace to max_points. A full figure is built instead on the first
+        # call, after a restart, or when the gap is larger than the window.
+        return self.read_window(
+            lambda indices, data: self.stream_window(indices, data, cursor)
+        )
+
+    def stream_window(self, indices, data, cursor):
+        if data.shape[0] == 0:
+            return self.aggregate_figure(indices, data), None, None
+
+        last = int(indices[-1])
+        if cursor is None or cursor > last or cursor < indices[0] - 1:
+            return self.aggregate_figure(indices, data), None, last
+        if cursor == last:
+            return None, None, cursor
+
+        new = indices > cursor
+        new_indices, new_data = indices[new], data[new]
+
+        # Keep the same point density as the full window
+        budget = max(4, -(-new_data.shape[0] * self.max_points // data.shape[0]))
+        xs, ys = [], []
+        for ch in range(new_data.shape[1]):
+            x, y = downsample(new_indices, new_data[:, ch], budget, self.mode)
+            xs.append(x)
+            ys.append(y)
+
+        extend_data = (
+            dict(x=xs, y=ys),
+            list(range(new_data.shape[1])),
+            self.max_points,
+        )
+        return None, extend_data, last
+
+    extent = polled_extent
+
+    def live_frame(self, previous=None, history=8):
+        # FigureCache build step for stream_from: the full figure of the
+        # newest window, plus the extendData steps taking a tab from each
+        # of the last few cursors to this one
+        def build(indices, data):
+            figure, _, cursor = self.stream_window(indices, data, None)
+            steps = []
+            if previous is not None and previous["cursor"] is not None:
+                steps = previous["steps"]
+                old = previous["cursor"]
+                refigure, extend_data, _ = self.stream_window(indices, data, old)
+                if refigure is not None:
+                    steps = []
+                elif extend_data is not None:
+                    steps = steps[-(history - 1) :] + [(old, extend_data)]
+            return dict(figure=figure, cursor=cursor, steps=steps)
+
+        return self.read_window(build)
+
+    def stream_from(self, frame, cursor=None):
+        # stream_live_plot_aggregate for a tab at `cursor`, answered from a
+        # cached live_frame instead of the reader
+        if frame["cursor"] is None:
+            return frame["figure"], None, None
+        if cursor == frame["cursor"]:
+            return None, None, cursor
+
+        starts = [old for old, _ in frame["steps"]]
+        if cursor not in starts:
+            return frame["figure"], None, frame["cursor"]
+        steps = [extend_data for _, extend_data in frame["steps"]]
+        steps = steps[starts.index(cursor) :]
+
+        channels = range(len(steps[0][1]))
+        extend_data = (
+            dict(
+                x=[
+                    np.concatenate([step[0]["x"][ch] for step in steps])
+                    for ch in channels
+                ],
+                y=[
+                    np.concatenate([step[0]["y"][ch] for step in steps])
+                    for ch in channels
+                ],
+            ),
+            steps[0][1],
+            self.max_points,
+        )
+        return None, extend_data, frame["cursor"]
+
 
 class Overview:
-    def __init__(self, file_name, decimation_factor):
+    def __init__(self, file_name, max_points=4000, mode="minmax", max_regions=200):
         self.file_name = file_name
         self.subplot_rows = 2
         self.subplot_cols = 2
-        self.decimation_factor = decimation_factor
+        self.max_points = max_points
+        self.mode = mode
+        self.max_regions = max_regions
+        self.reader = None
+
+    def open(self):
+        # Kept open between extent() checks so an unchanged file costs one
+        # metadata refresh
+        if self.reader is None:
+            reader = Reader(self.file_name)
+            reader.open()
+            self.reader = reader
+        return self.reader
+
+    def extent(self):
+        # FigureCache key: the valid row count and the view parameters
+        reader = self.open()
+        rows = valid_rows(reader.h5, reader.dset)
+        return (self.file_name, rows, self.max_points, self.mode, self.max_regions)
 
     def create_overview_plots(self):
+        if self.reader is not None:
+            return self.overview_figure(self.reader)
         reader = Reader(self.file_name)
         reader.open()
-        indices, data = reader.overview_data()
-        if data.shape[0] == 0:
+        try:
+            return self.overview_figure(reader)
+        finally:
             reader.close()
-            return go.Figure().update_layout(title="No data yet")
 
-        decimation_factor = self.decimation_factor
+    def overview_figure(self, reader):
+        indices, data = reader.overview_data(self.max_points)
+        if data.shape[0] == 0:
+            return go.Figure().update_layout(title="No data yet")
 
         fig = make_subplots(rows=self.subplot_rows, cols=self.subplot_cols)
 
         for subplot_row in range(1, self.subplot_rows + 1):
             for subplot_col in range(1, self.subplot_cols + 1):
-                downsampled_signal = decimate(
+                # Min/max pairs from the overview levels are already within
+                # budget and pass through unchanged
+                downsampled_indices, downsampled_signal = downsample(
+                    indices,
                     data[:, 2 * (subplot_row - 1) + (subplot_col - 1)],
-                    decimation_factor,
+                    self.max_points,
+                    self.mode,
                 )
-                downsampled_indices = indices[::decimation_factor]
                 fig.add_trace(
                     go.Scattergl(x=downsampled_indices, y=downsampled_signal),
                     row=subplot_row,
                     col=subplot_col,
                 )
-        reader.close()
+
+        # Shade PLL-unlock / chip-error regions, merged to at most about
+        # max_regions shapes so long recordings stay cheap to render
+        end_index = int(indices[-1]) + 1
+        for start, stop in reader.bad_regions(
+            end_index, min_gap=end_index // self.max_regions
+        ):
+            fig.add_vrect(
+                x0=start,
+                x1=stop,
+                fillcolor="red",
+                opacity=0.2,
+                line_width=0,
+                row="all",
+                col="all",
+            )
 
         return fig
 
+    def close(self):
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
 
 class DacTestLiveView:
-    def __init__(self, file_name, decimation_factor=1):
+    def __init__(self, file_name, max_points=4000, mode="lttb"):
         self.file_name = file_name
-        self.decimation_factor = decimation_factor
+        self.max_points = max_points
+        self.mode = mode
+        self.reader = TailReader(file_name, window_rows=1000, lag_rows=2)
+
+    extent = polled_extent
 
     def fit(self, dac_ds, adc_ds):
         slope, intercept = np.polyfit(dac_ds, adc_ds, 1)
         return slope, intercept
 
     def create_live_plots(self):
-        reader = DAC_Reader(self.file_name)
-        reader.open()
-        dac, adc, se = reader.live_view_data()
-        reader.close()
+        _, block = self.reader.poll()
+        if block.shape[0] == 0:
+            return go.Figure().update_layout(title="No data yet")
+        dac = block[:, 0]
+        adc = block[:, 1]
+        se = block[:, 2]
 
         # no raw data at all?  show placeholder
         if len(dac) == 0:
             return go.Figure().update_layout(title="No data yet")
 
-        # downsample
-        df = max(1, self.decimation_factor)
-        if df > 1 and len(dac) > 27:
-            dac_ds = decimate(dac, df)
-            adc_ds = decimate(adc, df)
-            se_ds = decimate(se, df)
-        else:
-            dac_ds = dac[::df]
-            adc_ds = adc[::df]
-            se_ds = se[::df]
-
-        order = np.argsort(dac_ds)
+        order = np.argsort(dac)
+        dac = dac[order]
+        adc = adc[order]
+        se = se[order]
 
-        dac_ds = dac_ds[order]
-        adc_ds = adc_ds[order]
-        se_ds = se_ds[order]
+        # downsample along the DAC axis; the fit below still uses every point
+        if self.mode == "lttb":
+            idx = lttb_indices(dac, adc, self.max_points)
+        else:
+            idx = minmax_indices(adc, self.max_points)
+        dac_ds = dac[idx]
+        adc_ds = adc[idx]
+        se_ds = se[idx]
         trace = go.Scattergl(
             x=dac_ds,
             y=adc_ds,
@@ -163,10 +481,10 @@ class DacTestLiveView:
             ),
         )
 
-        if len(dac_ds) < 2:
+        if len(dac) < 2:
             fig = go.Figure([trace])
             fig.update_layout(
-                title=f"ADC vs DAC (N = {len(dac_ds)})",
+                title=f"ADC vs DAC (N = {len(dac)})",
                 xaxis_title="DAC Voltage (V)",
                 yaxis_title="ADC Voltage (V)",
                 showlegend=False,
@@ -174,8 +492,8 @@ class DacTestLiveView:
             )
             return fig
 
-        slope, intercept = self.fit(dac_ds, adc_ds)
-        x_fit = np.array([dac_ds.min(), dac_ds.max()])
+        slope, intercept = self.fit(dac, adc)
+        x_fit = np.array([dac.min(), dac.max()])
         y_fit = slope * x_fit + intercept
         fit_trace = go.Scatter(
             x=x_fit,
@@ -187,7 +505,7 @@ class DacTestLiveView:
 
         fig = go.Figure([trace, fit_trace])
         fig.update_layout(
-            title=f"ADC vs DAC (N = {len(dac_ds)})",
+            title=f"ADC vs DAC (N = {len(dac)})",
             xaxis_title="DAC Voltage (V)",
             yaxis_title="ADC Voltage (V)",
             showlegend=True,
@@ -200,27 +518,19 @@ class DacTestLiveView:
 
 
 if __name__ == "__main__":
-    import h5py
-
-    def create_overview_plots(file_name, decimation_factor=1):
-        with h5py.File(file_name, "r", libver="latest", swmr=True) as f:
-            dset = f["data"]
-            num_chunks = dset.shape[0] // dset.chunks[0]
-            if num_chunks > 10:
-                end_index = dset.shape[0] - 5 * dset.chunks[0]
-            else:
-                end_index = num_chunks * dset.chunks[0]
 
-            indices = np.arange(0, end_index)
-            data = dset[0:end_index]
+    def create_overview_plots(file_name, max_points=4000):
+        # Streams the file through Reader so recordings larger than RAM work
+        reader = Reader(file_name)
+        reader.open()
+        indices, data = reader.overview_data(max_points)
+        reader.close()
 
         fig, axes = plt.subplots(2, 2, figsize=(12, 8))
         axes = axes.flatten()
 
         for i in range(4):
-            downsampled_signal = decimate(data[:, i], decimation_factor)
-            downsampled_indices = indices[::decimation_factor]
-            axes[i].plot(downsampled_indices, downsampled_signal)
+            axes[i].plot(indices, data[:, i])
             axes[i].set_title(f"Channel {i+1}")
             axes[i].set_xlabel("Sample Index")
             axes[i].set_ylabel("Amplitude")
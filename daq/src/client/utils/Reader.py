@@ -1,3 +1,6 @@
+import json
+import os
+import threading
 import h5py
 import plotly.express as px
 from plotly.subplots import make_subplots
@@ -6,6 +9,325 @@ import numpy as np
 from scipy.signal import decimate
 
 
+class SegmentedDataset:
+    # One dataset name across every segment of a rotated capture, indexed
+    # by global row. Supports the slicing the readers use: a row slice,
+    # optionally followed by indices for the other axes.
+    def __init__(self, capture, name):
+        self.capture = capture
+        self.name = name
+        self.parts = capture.parts(name)
+        self.refreshed = 0
+
+    def lengths(self):
+        # Closed segments keep their preallocated tail, so their length
+        # comes from the manifest
+        lengths = []
+        for entry, part in zip(self.capture.entries, self.parts):
+            valid = self.capture.valid_length(self.name, entry)
+            lengths.append(
+                part.shape[0] if valid is None else min(part.shape[0], valid)
+            )
+        return lengths
+
+    def refresh(self):
+        self.capture.reload()
+        self.parts = self.capture.parts(self.name)
+        # Closed segments never change again, so only segments not yet
+        # seen closed need their metadata refreshed
+        for part in self.parts[self.refreshed :]:
+            part.refresh()
+        self.refreshed = self.capture.closed
+
+    @property
+    def shape(self):
+        return (sum(self.lengths()),) + self.parts[0].shape[1:]
+
+    @property
+    def chunks(self):
+        return self.parts[0].chunks
+
+    @property
+    def dtype(self):
+        return self.parts[0].dtype
+
+    @property
+    def attrs(self):
+        return self.parts[0].attrs
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows, rest = key[0], key[1:]
+        if isinstance(rows, (int, np.integer)):
+            return self[(slice(rows, rows + 1),) + rest][0]
+
+        lengths = self.lengths()
+        start, stop, step = rows.indices(sum(lengths))
+        if step != 1:
+            raise ValueError("Only contiguous row slices are supported")
+        pieces = []
+        offset = 0
+        for part, n in zip(self.parts, lengths):
+            lo, hi = max(start, offset), min(stop, offset + n)
+            if lo < hi:
+                pieces.append(part[(slice(lo - offset, hi - offset),) + rest])
+            offset += n
+        if not pieces:
+            return self.parts[0][(slice(0, 0),) + rest]
+        return np.concatenate(pieces)
+
+
+class SegmentedRows:
+    # Stands in for the "rows" dataset: the valid row count of the whole
+    # capture
+    def __init__(self, capture):
+        self.capture = capture
+
+    def refresh(self):
+        self.capture.reload()
+
+    def __getitem__(self, index):
+        total = 0
+        parts = self.capture.parts("data")
+        for entry, segment, part in zip(
+            self.capture.entries, self.capture.segments, parts
+        ):
+            if entry["rows"] is not None:
+                total += entry["rows"]
+                continue
+            rows_ds = segment["rows"]
+            rows_ds.refresh()
+            rows = int(rows_ds[0])
+            part.refresh()
+            total += min(rows, part.shape[0])
+        return total
+
+
+class SegmentedGroup:
+    def __init__(self, capture, name):
+        self.capture = capture
+        self.name = name
+
+    def __len__(self):
+        return len(self.capture.segments[0][self.name])
+
+    def values(self):
+        return [
+            SegmentedDataset(self.capture, f"{self.name}/{key}")
+            for key in self.capture.segments[0][self.name]
+        ]
+
+
+class SegmentedFile:
+    # Read-only view of a capture that DAQ rotated into several files,
+    # opened through its manifest. Datasets are stitched per read rather
+    # than with an HDF5 virtual dataset: a VDS has a fixed mapping that
+    # would have to be rebuilt on every rollover, and cannot follow the
+    # newest segment while it is still growing under SWMR.
+    def __init__(self, manifest_name):
+        self.manifest_name = manifest_name
+        self.directory = os.path.dirname(manifest_name)
+        self.segments = []
+        self.entries = []
+        self.datasets = {}
+        self.closed = 0
+        self.mtime = None
+        self.reload()
+
+    def reload(self):
+        mtime = os.stat(self.manifest_name).st_mtime_ns
+        if mtime == self.mtime:
+            return
+        with open(self.manifest_name) as f:
+            manifest = json.load(f)
+        self.mtime = mtime
+
+        self.entries = manifest["segments"]
+        self.samples = manifest["samples"]
+        for entry in self.entries[len(self.segments) :]:
+            self.segments.append(
+                h5py.File(
+                    os.path.join(self.directory, entry["file"]),
+                    "r",
+                    libver="latest",
+                    swmr=True,
+                )
+            )
+        self.closed = sum(entry["rows"] is not None for entry in self.entries)
+        if not self.segments:
+            raise OSError(f"'{self.manifest_name}' lists no segments yet")
+
+    def parts(self, name):
+        # The same h5py objects are shared by every view of a dataset;
+        # refreshing several handles to one dataset upsets HDF5
+        parts = self.datasets.setdefault(name, [])
+        for segment in self.segments[len(parts) :]:
+            parts.append(segment[name])
+        return list(parts)
+
+    def valid_length(self, name, entry):
+        # Valid length of a closed segment's "data" and per-frame datasets;
+        # None where the dataset's own shape applies
+        if entry["rows"] is None:
+            return None
+        if name == "data":
+            return entry["rows"]
+        if name in ("status", "frame_ticks"):
+            return entry["rows"] // self.samples
+        return None
+
+    def __contains__(self, name):
+        return name in self.segments[0]
+
+    def __getitem__(self, name):
+        if name == "rows":
+            return SegmentedRows(self)
+        if isinstance(self.segments[0][name], h5py.Group):
+            return SegmentedGroup(self, name)
+        return SegmentedDataset(self, name)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.datasets = {}
+
+
+class SharedCapture:
+    # One read-only handle per capture for the whole process, shared by
+    # every reader of it (live view, overview, ...) and closed when the
+    # last of them closes. HDF5 cannot refresh a dataset that is open
+    # twice in one process ("can't insert duplicate key"), so the dataset
+    # objects are shared too.
+    def __init__(self, file_name, key):
+        self.key = key
+        # Rotated captures are opened through their ".manifest.json"
+        if file_name.endswith(".json"):
+            self.h5 = SegmentedFile(file_name)
+        else:
+            self.h5 = h5py.File(file_name, "r", libver="latest", swmr=True)
+        self.items = {}
+        self.users = 1
+
+    def __contains__(self, name):
+        return name in self.h5
+
+    def __getitem__(self, name):
+        item = self.items.get(name)
+        if item is None:
+            item = self.items[name] = self.h5[name]
+        return item
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def close(self):
+        with captures_lock:
+            self.users -= 1
+            if self.users:
+                return
+            del open_captures[self.key]
+        self.items = {}
+        self.h5.close()
+
+
+open_captures = {}
+captures_lock = threading.Lock()
+
+
+def open_capture(file_name):
+    # Each open_capture needs a matching close() on the returned capture
+    key = os.path.abspath(file_name)
+    with captures_lock:
+        capture = open_captures.get(key)
+        if capture is not None:
+            capture.users += 1
+            return capture
+        capture = open_captures[key] = SharedCapture(file_name, key)
+        return capture
+
+
+def valid_rows(h5, dset):
+    # Files written by DAQ preallocate "data" and record the valid row
+    # count in "rows"; older files are exactly as long as their data.
+    # Refreshes dset too: "rows" is read first, since DAQ only counts rows
+    # once they are in the file.
+    rows = None
+    if "rows" in h5:
+        rows_ds = h5["rows"]
+        rows_ds.refresh()
+        rows = int(rows_ds[0])
+    dset.refresh()
+    return dset.shape[0] if rows is None else min(rows, dset.shape[0])
+
+
+def to_volts(dset, block):
+    # Raw-code captures store int32 codes and the LSB as an attribute
+    if np.issubdtype(dset.dtype, np.integer) and "LSB" in dset.attrs:
+        return (block * dset.attrs["LSB"]).astype(np.float32)
+    return block
+
+
+def sample_times(h5, start, stop):
+    # Seconds on the board clock for rows [start, stop). Captures store one
+    # tick count per frame in "frame_ticks"; each sample adds its position
+    # in the frame divided by the ODR. Older captures stored a float32
+    # time per row in "time".
+    if "frame_ticks" not in h5:
+        if "time" in h5:
+            time_ds = h5["time"]
+            time_ds.refresh()
+            return time_ds[start:stop, 0].astype(np.float64)
+        return None
+
+    ticks_ds = h5["frame_ticks"]
+    ticks_ds.refresh()
+    samples = int(ticks_ds.attrs["samples"])
+    if stop <= start:
+        return np.empty(0, dtype=np.float64)
+    first = start // samples
+    ticks = ticks_ds[first : (stop - 1) // samples + 1]
+
+    rows = np.arange(start, stop)
+    seconds = ticks / float(ticks_ds.attrs["ticks_per_second"])
+    return seconds[rows // samples - first] + (rows % samples) / ticks_ds.attrs["odr"]
+
+
+def bad_regions(h5, end_index=None, min_gap=0):
+    # [start, stop) row ranges with PLL-unlock or chip-error samples, read
+    # from the per-frame "status" summary instead of the raw samples.
+    # Regions less than min_gap rows apart are merged.
+    if "status" not in h5:
+        return np.empty((0, 2), dtype=np.int64)
+    frames = valid_rows(h5, h5["data"]) // int(h5["status"].attrs["samples"])
+    status_ds = h5["status"]
+    status_ds.refresh()
+    status = status_ds[: min(frames, status_ds.shape[0])]
+
+    bad = status[status["first_bad"] >= 0]
+    starts = bad["row"] + bad["first_bad"]
+    stops = bad["row"] + bad["last_bad"] + 1
+    if end_index is not None:
+        keep = starts < end_index
+        starts, stops = starts[keep], np.minimum(stops[keep], end_index)
+    if starts.size == 0:
+        return np.empty((0, 2), dtype=np.int64)
+
+    # Start a new region wherever the gap to the previous one is too big
+    new = np.ones(starts.size, dtype=bool)
+    new[1:] = starts[1:] - stops[:-1] > min_gap
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], starts.size) - 1
+    return np.column_stack([starts[first], stops[last]]).astype(np.int64)
+
+
 class Reader:
     def __init__(
         self, file_name, samples=1024 * 20, channels=4, header=0, dtype="float32"
@@ -20,39 +342,164 @@ class Reader:
         self.current_index = 0
 
     def open(self):
-        self.h5 = h5py.File(self.file_name, "r", libver="latest", swmr=True)
+        self.h5 = open_capture(self.file_name)
         self.dset = self.h5["data"]
 
     def live_view_data(self):
-        self.dset.refresh()
-        num_chunks = self.dset.shape[0] // self.dset.chunks[0]
+        rows = valid_rows(self.h5, self.dset)
+        num_chunks = rows // self.dset.chunks[0]
         start_index = 0
         if num_chunks > 10:
-            start_index = self.dset.shape[0] - 10 * self.dset.chunks[0]
-            end_index = self.dset.shape[0] - 5 * self.dset.chunks[0]
+            start_index = rows - 10 * self.dset.chunks[0]
+            end_index = rows - 5 * self.dset.chunks[0]
         else:
             end_index = num_chunks * self.dset.chunks[0]
         indices = np.arange(start=start_index, stop=end_index)
-        sliced_chunks = self.dset[start_index:end_index]
+        sliced_chunks = to_volts(self.dset, self.dset[start_index:end_index])
         return indices, sliced_chunks
 
-    def overview_data(self):
-        self.dset.refresh()
-        num_chunks = self.dset.shape[0] // self.dset.chunks[0]
+    def overview_data(self, max_points=None):
+        rows = valid_rows(self.h5, self.dset)
+        num_chunks = rows // self.dset.chunks[0]
 
         if num_chunks > 10:
-            end_index = self.dset.shape[0] - 5 * self.dset.chunks[0]
+            end_index = rows - 5 * self.dset.chunks[0]
         else:
             end_index = num_chunks * self.dset.chunks[0]
+
+        if max_points is not None:
+            if len(self.h5.get("overview", ())):
+                return self.overview_level_data(end_index, max_points)
+            return self.overview_stream_data(end_index, max_points)
+
         indices = np.arange(start=0, stop=end_index)
-        sliced_chunks = self.dset[0:end_index]
+        sliced_chunks = to_volts(self.dset, self.dset[0:end_index])
         return indices, sliced_chunks
 
+    def overview_level_data(self, end_index, max_points):
+        # Pick the finest overview level whose min/max pairs fit the budget
+        # (or the coarsest one if none does). Cost depends only on the
+        # number of points returned, not on the length of the recording.
+        levels = sorted(self.h5["overview"].values(), key=lambda ds: ds.attrs["factor"])
+        for level in levels:
+            level.refresh()
+            factor = int(level.attrs["factor"])
+            blocks = min(level.shape[0], end_index // factor)
+            if 2 * blocks <= max_points:
+                break
+
+        stats = level[:blocks]
+
+        # Interleave each block's min and max at the block start so spikes
+        # survive as vertical strokes
+        indices = np.repeat(np.arange(blocks) * factor, 2)
+        data = np.empty((2 * blocks, stats.shape[2]), dtype=np.float32)
+        data[0::2] = stats[:, 0]
+        data[1::2] = stats[:, 1]
+        return indices, data
+
+    def overview_stream_data(self, end_index, max_points, chunks_per_read=16):
+        # Out-of-core fallback for files without overview levels. The
+        # dataset is walked a few chunks at a time and reduced into
+        # max_points // 2 min/max buckets, so memory stays bounded by one
+        # read block plus the output however long the recording is.
+        buckets = max(1, max_points // 2)
+        size = max(1, -(-end_index // buckets))
+        n_buckets = -(-end_index // size)
+        mins = np.full((n_buckets,) + self.dset.shape[1:], np.inf, dtype=np.float32)
+        maxs = np.full((n_buckets,) + self.dset.shape[1:], -np.inf, dtype=np.float32)
+
+        step = self.dset.chunks[0] * chunks_per_read
+        for start in range(0, end_index, step):
+            stop = min(start + step, end_index)
+            block = to_volts(self.dset, self.dset[start:stop])
+
+            first, last = start // size, (stop - 1) // size + 1
+            bounds = np.arange(first, last) * size - start
+            bounds[0] = 0
+            mins[first:last] = np.minimum(
+                mins[first:last], np.minimum.reduceat(block, bounds, axis=0)
+            )
+            maxs[first:last] = np.maximum(
+                maxs[first:last], np.maximum.reduceat(block, bounds, axis=0)
+            )
+
+        indices = np.repeat(np.arange(n_buckets) * size, 2)
+        data = np.empty((2 * n_buckets,) + self.dset.shape[1:], dtype=np.float32)
+        data[0::2] = mins
+        data[1::2] = maxs
+        return indices, data
+
+    def bad_regions(self, end_index=None, min_gap=0):
+        return bad_regions(self.h5, end_index, min_gap)
+
+    def timestamps(self, start, stop):
+        return sample_times(self.h5, start, stop)
+
+    def time_to_row(self, seconds):
+        # First row sampled at or after `seconds` on the board clock. The
+        # per-frame ticks are binary searched in place, so only a few of
+        # their chunks are read however long the capture is.
+        rows = valid_rows(self.h5, self.dset)
+        if "frame_ticks" not in self.h5:
+            if "time" not in self.h5:
+                raise ValueError(f"'{self.file_name}' has no timestamps")
+            time_ds = self.h5["time"]
+            time_ds.refresh()
+            return int(np.searchsorted(time_ds[:rows, 0], seconds))
+
+        ticks_ds = self.h5["frame_ticks"]
+        ticks_ds.refresh()
+        samples = int(ticks_ds.attrs["samples"])
+        ticks_per_second = float(ticks_ds.attrs["ticks_per_second"])
+        target = round(seconds * ticks_per_second)
+
+        # Last frame starting at or before the target
+        lo, hi = 0, min(rows // samples, ticks_ds.shape[0])
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if int(ticks_ds[mid]) <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        frame = lo - 1
+        if frame < 0:
+            return 0
+
+        elapsed = (target - int(ticks_ds[frame])) / ticks_per_second
+        offset = int(np.ceil(elapsed * ticks_ds.attrs["odr"] - 1e-9))
+        return frame * samples + min(max(offset, 0), samples)
+
+    def read_range(
+        self, start=None, stop=None, start_time=None, stop_time=None, channels=None
+    ):
+        # Rows [start, stop), or the rows sampled in [start_time, stop_time)
+        # seconds, optionally restricted to some channels. Only the chunks
+        # covering the range are read.
+        rows = valid_rows(self.h5, self.dset)
+        if start_time is not None:
+            start = self.time_to_row(start_time)
+        if stop_time is not None:
+            stop = self.time_to_row(stop_time)
+        start = 0 if start is None else min(max(start, 0), rows)
+        stop = rows if stop is None else min(max(stop, start), rows)
+
+        if channels is None:
+            block = self.dset[start:stop]
+        else:
+            # h5py wants increasing channel indices; restore the order asked
+            channels = list(np.atleast_1d(channels))
+            wanted = sorted(set(channels))
+            block = self.dset[start:stop, wanted]
+            block = block[:, [wanted.index(channel) for channel in channels]]
+        return np.arange(start, stop), to_volts(self.dset, block)
+
     def close(self):
         try:
             self.h5.close()
         except:
             print("Could not close file")
+        self.h5 = None
 
 
 class DAC_Reader:
@@ -66,7 +513,7 @@ class DAC_Reader:
         self.dset = None
 
     def open(self):
-        self.h5 = h5py.File(self.file_name, "r", libver="latest", swmr=True)
+        self.h5 = open_capture(self.file_name)
         self.dset = self.h5[self.dataset_name]
 
     def live_view_data(self, look_back_chunks: int = 1000, lag_samples: int = 2):
@@ -85,7 +532,7 @@ class DAC_Reader:
 
         indices = np.arange(start, end)
 
-        block = self.dset[start:end]
+        block = to_volts(self.dset, self.dset[start:end])
 
         dac = block[:, 0]
         adc = block[:, 1]
@@ -105,7 +552,7 @@ class DAC_Reader:
             end = total
 
         indices = np.arange(0, end)
-        block = self.dset[0:end]
+        block = to_volts(self.dset, self.dset[0:end])
         dac = block[:, 0]
         adc = block[:, 1]
         se = block[:, 2]
@@ -117,6 +564,96 @@ class DAC_Reader:
                 self.h5.close()
             except Exception as e:
                 print(f"Warning: could not close file: {e}")
+        self.h5 = None
+
+
+class TailReader:
+    # Long-lived SWMR reader for the live views. The file stays open between
+    # polls and only rows appended since the last poll are read. They are
+    # kept in a ring buffer that stores every row twice (at i and
+    # i + window_rows), so the newest window is always one contiguous slice.
+    # The returned data is a view that stays valid until the next poll.
+    # The window is window_rows rows if given, else window_chunks chunks of
+    # the dataset.
+    def __init__(
+        self,
+        file_name,
+        dataset_name="data",
+        window_chunks=10,
+        lag_rows=0,
+        window_rows=None,
+    ):
+        self.file_name = file_name
+        self.dataset_name = dataset_name
+        self.window_chunks = window_chunks
+        self.window = window_rows
+        self.lag_rows = lag_rows
+
+        self.h5 = None
+        self.dset = None
+        self.ring = None
+        self.window_rows = 0
+        self.end = 0
+        self.lock = threading.Lock()
+
+    def open(self):
+        self.h5 = open_capture(self.file_name)
+        self.dset = self.h5[self.dataset_name]
+        self.window_rows = self.window or self.window_chunks * self.dset.chunks[0]
+        self.ring = np.empty(
+            (2 * self.window_rows,) + self.dset.shape[1:], dtype=np.float32
+        )
+        self.end = 0
+
+    def poll(self):
+        with self.lock:
+            if self.h5 is None:
+                try:
+                    self.open()
+                except (OSError, KeyError):
+                    # Acquisition has not created the file yet
+                    return np.arange(0), np.empty((0,))
+
+            rows = max(0, valid_rows(self.h5, self.dset) - self.lag_rows)
+            if rows < self.end:
+                # The file was recreated under us; reopen on the next poll
+                self.close()
+                return np.arange(0), np.empty((0,))
+
+            start = max(self.end, rows - self.window_rows)
+            if rows > start:
+                block = to_volts(self.dset, self.dset[start:rows])
+                self._store(start, block)
+            self.end = rows
+
+            first = max(0, rows - self.window_rows)
+            pos = first % self.window_rows
+            data = self.ring[pos : pos + (rows - first)]
+            return np.arange(first, rows), data
+
+    def verify(self):
+        # Polled windows are private to this reader and never overwritten
+        # behind its back (see live_ring.LiveRingReader.verify)
+        return True
+
+    def _store(self, start, block):
+        window = self.window_rows
+        while block.shape[0]:
+            pos = start % window
+            n = min(block.shape[0], window - pos)
+            self.ring[pos : pos + n] = block[:n]
+            self.ring[pos + window : pos + window + n] = block[:n]
+            start += n
+            block = block[n:]
+
+    def close(self):
+        if self.h5 is not None:
+            try:
+                self.h5.close()
+            except Exception as e:
+                print(f"Warning: could not close file: {e}")
+        self.h5 = None
+        self.dset = None
 
 
 if __name__ == "__main__":
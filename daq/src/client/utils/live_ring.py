@@ -0,0 +1,172 @@
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+
+"""
+Shared-memory ring of the newest decoded samples, written by the DAQ
+process and read by the dashboard without going through HDF5.
+
+The block starts with HEADER_FIELDS int64 values followed by a float32
+ring of 2 * capacity rows. Every row is written twice (at i and
+i + capacity) so the newest window is always one contiguous slice that
+readers can use without copying.
+
+There are no locks. The writer bumps "claimed" to the end of the rows it
+is about to write, writes them, then bumps "committed". A reader takes a
+window ending at "committed" and, once done with it, checks that
+"claimed" has not advanced far enough to reach that window.
+"""
+
+MAGIC = 0x4144343133340001
+HEADER_FIELDS = 8
+MAGIC_FIELD, CAPACITY, CHANNELS, CLAIMED, COMMITTED, CLOSED = range(6)
+
+
+def attach(name):
+    # Attach without registering with the resource tracker, which would
+    # otherwise unlink the writer's block when this process exits
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class LiveRing:
+    def __init__(self, name: str, channels: int, capacity: int):
+        size = 8 * HEADER_FIELDS + 4 * 2 * capacity * channels
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a run that did not shut down cleanly
+            stale = attach(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        self.header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=self.shm.buf)
+        self.ring = np.ndarray(
+            (2 * capacity, channels),
+            dtype=np.float32,
+            buffer=self.shm.buf,
+            offset=8 * HEADER_FIELDS,
+        )
+        self.capacity = capacity
+        self.header[:] = 0
+        self.header[CAPACITY] = capacity
+        self.header[CHANNELS] = channels
+        self.header[MAGIC_FIELD] = MAGIC
+
+    def publish(self, values, first_row: int):
+        # Rows [first_row, first_row + len(values)) of the capture, in volts
+        skip = max(0, len(values) - self.capacity)
+        values = values[skip:]
+        start = first_row + skip
+        end = start + len(values)
+
+        self.header[CLAIMED] = end
+        capacity = self.capacity
+        while len(values):
+            pos = start % capacity
+            n = min(len(values), capacity - pos)
+            self.ring[pos : pos + n] = values[:n]
+            self.ring[pos + capacity : pos + capacity + n] = values[:n]
+            start += n
+            values = values[n:]
+        self.header[COMMITTED] = end
+
+    def close(self):
+        self.header[CLOSED] = 1
+        self.header = self.ring = None
+        self.shm.unlink()
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with it
+            pass
+
+
+class LiveRingReader:
+    # Same poll() interface as Reader.TailReader. Falls back to `fallback`
+    # (normally a TailReader on the HDF5 file) while no writer is running.
+    def __init__(self, name: str, window_rows: int | None = None, fallback=None):
+        self.name = name
+        self.window_rows = window_rows
+        self.fallback = fallback
+        self.shm = None
+        self.header = None
+        self.ring = None
+        self.window = None
+        self.retry_at = 0.0
+
+    def open(self):
+        shm = attach(self.name)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if header[MAGIC_FIELD] != MAGIC or header[CLOSED]:
+            del header
+            shm.close()
+            raise FileNotFoundError(self.name)
+        capacity, channels = int(header[CAPACITY]), int(header[CHANNELS])
+        self.shm = shm
+        self.header = header
+        self.ring = np.ndarray(
+            (2 * capacity, channels),
+            dtype=np.float32,
+            buffer=shm.buf,
+            offset=8 * HEADER_FIELDS,
+        )
+        self.capacity = capacity
+        # Leave most of the ring as slack so the writer cannot lap a window
+        # while it is being plotted
+        self.window_rows = min(self.window_rows or capacity // 4, capacity // 2)
+
+    def poll(self):
+        if self.header is not None and self.header[CLOSED]:
+            self.detach()
+        if self.header is None and time.monotonic() >= self.retry_at:
+            try:
+                self.open()
+            except FileNotFoundError:
+                self.retry_at = time.monotonic() + 1.0
+            else:
+                # Release the file while the ring is live; the fallback
+                # reopens it if the writer goes away
+                if self.fallback is not None:
+                    self.fallback.close()
+        if self.header is None:
+            self.window = None
+            if self.fallback is not None:
+                return self.fallback.poll()
+            return np.arange(0), np.empty((0,))
+
+        end = int(self.header[COMMITTED])
+        first = max(0, end - self.window_rows)
+        self.window = (first, end)
+        pos = first % self.capacity
+        return np.arange(first, end), self.ring[pos : pos + (end - first)]
+
+    def verify(self):
+        # True if the window from the last poll was not overwritten while
+        # it was in use
+        if self.window is None:
+            return True
+        first, end = self.window
+        return int(self.header[CLAIMED]) - first <= self.capacity
+
+    def detach(self):
+        if self.shm is None:
+            return
+        self.header = self.ring = None
+        self.window = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A caller still holds a view; the mapping goes away with it
+            pass
+        self.shm = None
+
+    def close(self):
+        self.detach()
+        if self.fallback is not None:
+            self.fallback.close()
@@ -1,6 +1,16 @@
+import os
+import sys
+import time
 from multiprocessing import Process, Event
+
+# The client modules import each other by bare name, as when they are run
+# from their own directories
+client = os.path.join(os.path.dirname(os.path.abspath(__file__)), "client")
+sys.path[:0] = [os.path.join(client, "daq"), os.path.join(client, "utils")]
 from client.dashboards import dashboard
-from client.daq import daq as DAQ
+from daq import DAQ
+from live_ring import LiveRing
+from multi_board import MultiBoardDAQ, board_filename
 
 ################
 # Board Config #
@@ -9,27 +19,126 @@ board_ip = "192.168.1.10"
 port = 7
 samples = 1024 * 20  # Must be consistent with the value set in ad4134/parameters.h
 channels = 4
+# Extra (ip, port) pairs record several boards from this one process, each
+# into "<run_id>-<board>.hdf5"; the dashboard shows the first board
+extra_boards = []
 
 ###############
 # Data Config #
 ###############
 timestamp_header = 0  # Timestamp header is work in progress. Leave at 0
 file_name = "test.hdf5"
+run_id = time.strftime("%Y%m%d-%H%M%S")  # Shared by every board of a run
+# Roll over to a new file after this many bytes and/or seconds (None to
+# disable). Segments are listed in "<name>.manifest.json".
+rotate_bytes = None
+rotate_interval = None
+
+###################
+# Pipeline Config #
+###################
+pipelined = True  # Receive, decode and write on separate threads
+queue_depth = 8  # Frames buffered between stages before the receiver blocks
+
+###############
+# Link Config #
+###############
+# Kernel receive buffer in bytes (None for the OS default). Linux caps it at
+# net.core.rmem_max; the size actually granted is in the rcvbuf_bytes metric.
+rcvbuf = 4 * 1024 * 1024
+nodelay = False  # TCP_NODELAY
+quickack = False  # Re-arm TCP_QUICKACK after every frame (Linux)
+rx_queue_alert = 0.75  # Alert when the receive queue is this full
+stall_frames = 4.0  # Alert when no frame arrives for this many frame periods
+
+##################
+# Metrics Config #
+##################
+metrics_port = 9107  # JSON snapshot at http://127.0.0.1:<port>/metrics, None to disable
+metrics_attrs = True  # Also store snapshots in the "metrics" attribute of the data
+report_interval = 10.0  # Seconds between printed throughput summaries
+
+####################
+# Live View Config #
+####################
+# Shared memory the DAQ process publishes decoded frames to, so the live
+# view does not have to wait for HDF5 flushes (None to read the file only)
+live_ring_name = "ad4134-live"
+live_ring_frames = 40  # The live view shows the newest quarter of the ring
 
 
 stop_event = Event()
 
 
 def collect_data(
-    board_ip, port, samples, channels, timestamp_header, file_name, stop_event
+    board_ip, port, samples, channels, timestamp_header, file_name, run_id, stop_event
 ):
 
-    daq = DAQ(board_ip, port, samples, channels, timestamp_header, file_name)
+    if extra_boards:
+        multi_daq = MultiBoardDAQ(
+            [(board_ip, port)] + extra_boards,
+            samples,
+            channels,
+            timestamp_header,
+            run_id=run_id,
+            queue_depth=queue_depth,
+            metrics_port=metrics_port,
+            metrics_attrs=metrics_attrs,
+            report_interval=report_interval,
+            rotate_bytes=rotate_bytes,
+            rotate_interval=rotate_interval,
+            rcvbuf=rcvbuf,
+            nodelay=nodelay,
+            quickack=quickack,
+            rx_queue_alert=rx_queue_alert,
+            stall_frames=stall_frames,
+        )
+        multi_daq.run(stop_event)
+        return
+
+    live_ring = None
+    if live_ring_name is not None:
+        live_ring = LiveRing(live_ring_name, channels, live_ring_frames * samples)
+
+    daq = DAQ(
+        board_ip,
+        port,
+        samples,
+        channels,
+        timestamp_header,
+        file_name,
+        metrics_port=metrics_port,
+        metrics_attrs=metrics_attrs,
+        report_interval=report_interval,
+        run_id=run_id,
+        rotate_bytes=rotate_bytes,
+        rotate_interval=rotate_interval,
+        publisher=live_ring,
+        rcvbuf=rcvbuf,
+        nodelay=nodelay,
+        quickack=quickack,
+        rx_queue_alert=rx_queue_alert,
+        stall_frames=stall_frames,
+    )
     daq.init_hdf5()
-    daq.run(stop_event)
+    try:
+        if pipelined:
+            daq.run_pipelined(stop_event, queue_depth)
+        else:
+            daq.run(stop_event)
+    finally:
+        if live_ring is not None:
+            live_ring.close()
 
 
 if __name__ == "__main__":
+    dashboard_file = file_name
+    if extra_boards:
+        dashboard_file = board_filename("{run_id}-{board}.hdf5", run_id, board_ip, port)
+    if rotate_bytes is not None or rotate_interval is not None:
+        # The dashboard follows every segment through the manifest
+        dashboard_file = DAQ.manifest_name(dashboard_file)
+
     daq_process = Process(
         target=collect_data,
         args=(
@@ -39,11 +148,15 @@ if __name__ == "__main__":
             channels,
             timestamp_header,
             file_name,
+            run_id,
             stop_event,
         ),
     )
 
-    dashboard_process = Process(target=dashboard.create_dashboard, args=(file_name,))
+    dashboard_process = Process(
+        target=dashboard.create_dashboard,
+        args=(dashboard_file, None if extra_boards else live_ring_name),
+    )
     try:
         daq_process.start()
         dashboard_process.start()